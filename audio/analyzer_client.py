@@ -0,0 +1,110 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client side of the resident analyzer.
+
+Requests and replies are length-prefixed frames on a Unix stream socket: a
+JSON header, for PCM requests followed by a frame of raw int16 samples.
+Only the standard library is used, so a client starts in milliseconds.
+"""
+
+import json
+import socket
+import struct
+
+from . import params
+
+
+__all__ = ['AnalyzerError', 'analyze_file', 'analyze_pcm']
+
+
+_LENGTH = struct.Struct('>I')
+
+
+class AnalyzerError(Exception):
+    """Analyzer failed to process a request."""
+
+
+def send_frame(sock, payload):
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    """
+    Read one frame
+    :param sock: Connected socket
+    :return: Payload bytes, None if the peer closed the connection
+    """
+    header = _recv_exact(sock, _LENGTH.size)
+    if header is None:
+        return None
+    size, = _LENGTH.unpack(header)
+    return _recv_exact(sock, size) if size else b''
+
+
+def _request(socket_path, header, pcm=None, timeout=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        send_frame(sock, json.dumps(header).encode('utf-8'))
+        if pcm is not None:
+            send_frame(sock, pcm)
+        reply = recv_frame(sock)
+    finally:
+        sock.close()
+
+    if reply is None:
+        raise AnalyzerError('Analyzer closed the connection')
+    reply = json.loads(reply.decode('utf-8'))
+    if 'error' in reply:
+        raise AnalyzerError(reply['error'])
+    return [tuple(p) for p in reply['labels']]
+
+
+def analyze_file(path, socket_path=params.ANALYZER_SOCKET, timeout=None):
+    """
+    Let the analyzer read and process a wav file
+    :param path: 16-bit wav file readable by the analyzer process
+    :param socket_path: Analyzer socket
+    :param timeout: Seconds to wait for the reply, None waits forever
+    :return: Predictions as from WavProcessor.get_predictions
+    """
+    return _request(socket_path, {'path': path}, timeout=timeout)
+
+
+def analyze_pcm(sample_rate, pcm, channels=1,
+                socket_path=params.ANALYZER_SOCKET, timeout=None):
+    """
+    Send samples to the analyzer and process them
+    :param sample_rate: Sample rate of pcm
+    :param pcm: Bytes of interleaved little-endian int16 samples, as in wav
+    :param channels: Channels in pcm
+    :param socket_path: Analyzer socket
+    :param timeout: Seconds to wait for the reply, None waits forever
+    :return: Predictions as from WavProcessor.get_predictions
+    """
+    header = {'sample_rate': sample_rate, 'channels': channels}
+    return _request(socket_path, header, pcm, timeout)
@@ -0,0 +1,111 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Resident analyzer.
+
+Keeps one processor loaded and serves requests from
+analyzer_client on a Unix socket, one at a time.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+
+import numpy as np
+from scipy.io import wavfile
+
+from .analyzer_client import recv_frame, send_frame
+
+
+__all__ = ['AnalyzerServer']
+
+logger = logging.getLogger('audio_analysis.analyzer_server')
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # A connection may carry any number of requests.
+        while True:
+            header = recv_frame(self.request)
+            if header is None:
+                return
+
+            try:
+                reply = {'labels': self._process(json.loads(
+                    header.decode('utf-8')))}
+            except Exception as e:
+                logger.exception('Request failed')
+                reply = {'error': '{}: {}'.format(type(e).__name__, e)}
+            send_frame(self.request, json.dumps(reply).encode('utf-8'))
+
+    def _process(self, header):
+        if 'path' in header:
+            sr, data = wavfile.read(header['path'])
+            if data.dtype != np.int16:
+                raise TypeError('Bad sample type: %r' % data.dtype)
+        else:
+            pcm = recv_frame(self.request)
+            if pcm is None:
+                raise EOFError('Connection closed before samples')
+            sr = int(header['sample_rate'])
+            data = np.frombuffer(pcm, '<i2').astype(np.int16, copy=False)
+            channels = int(header.get('channels', 1))
+            if channels > 1:
+                data = data.reshape(-1, channels)
+
+        predictions = self.server.processor.get_predictions(sr, data)
+        return [[label, float(score)] for label, score in predictions]
+
+
+class AnalyzerServer(socketserver.UnixStreamServer):
+    """Unix socket server around a loaded processor."""
+
+    def __init__(self, socket_path, processor):
+        """
+        Bind socket
+        :param socket_path: Socket file to create, a stale one left by a
+        crashed server is replaced. Only the user running the server may
+        connect, requests name files the server reads
+        :param processor: WavProcessor answering requests
+        """
+        if os.path.lexists(socket_path):
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise OSError('"{}" exists and isn\'t a socket'.format(
+                    socket_path))
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+            except OSError:
+                os.unlink(socket_path)
+            else:
+                raise OSError('"{}" is in use by a running analyzer'.format(
+                    socket_path))
+            finally:
+                probe.close()
+
+        self.processor = processor
+        socketserver.UnixStreamServer.__init__(self, socket_path, _Handler)
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        # Set before listen, nobody else can connect in between.
+        os.chmod(self.server_address, stat.S_IRUSR | stat.S_IWUSR)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
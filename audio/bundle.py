@@ -0,0 +1,220 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Frozen model bundle.
+
+One file with a frozen GraphDef holding both VGGish and the YouTube-8M
+classifier, stripped to the inference ops, the PCA parameters and the class
+labels, so a process can start predicting after a single graph import instead
+of building VGGish in Python, restoring two checkpoints and parsing the labels
+CSV.  Large constants are cut out of the GraphDef into arrays that are fed
+back on every run.
+
+An .npz bundle reads every array when it is loaded.  The same content can be
+written as a weight store instead, its arrays are memory-mapped, so loading
+reads almost nothing and analyzer processes on one host share one copy of the
+weights.
+"""
+
+import csv
+from collections import namedtuple
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.framework import meta_graph, tensor_util
+
+from . import params
+from .utils import vggish, weight_store
+
+
+__all__ = ['Bundle', 'export_bundle', 'load_bundle', 'read_class_map']
+
+
+Bundle = namedtuple('Bundle', ['graph_def', 'tensors', 'pca_matrix',
+                               'pca_means', 'class_map', 'feeds'])
+
+# Keys of Bundle.tensors, each is a tensor name in Bundle.graph_def.
+TENSOR_KEYS = ('vggish_input', 'vggish_output', 'youtube_input',
+               'youtube_num_frames', 'youtube_predictions')
+
+# Constants from this size on go to the arrays of a weight store.
+_MIN_STORED_BYTES = 1 << 12
+
+
+def _load_youtube_inference(sess, checkpoint_path):
+    # The checkpoint feeds the classifier from its training input pipeline.
+    # Map those tensors to placeholders so freezing keeps only the model.
+    meta_graph_def = meta_graph.read_meta_graph_file(
+        checkpoint_path + '.meta')
+
+    def collection_tensor(key):
+        return meta_graph_def.collection_def[key].node_list.value[0]
+
+    input_tensor = tf.placeholder(
+        tf.float32, shape=(None, params.MAX_FRAMES, params.EMBEDDING_SIZE),
+        name='youtube/input_batch_raw')
+    num_frames_tensor = tf.placeholder(
+        tf.int32, shape=(None,), name='youtube/num_frames')
+
+    saver = tf.train.import_meta_graph(
+        meta_graph_def, clear_devices=True, import_scope='m2',
+        input_map={
+            collection_tensor('input_batch_raw'): input_tensor,
+            collection_tensor('num_frames'): num_frames_tensor,
+        })
+    saver.restore(sess, checkpoint_path)
+
+    predictions_tensor = tf.get_collection('predictions')[0]
+    return input_tensor, num_frames_tensor, predictions_tensor
+
+
+def read_class_map():
+    """
+    Read class labels from params.CLASS_LABELS_INDICES
+    :return: Dict of class index to display name
+    """
+    class_map = {}
+    with open(params.CLASS_LABELS_INDICES) as f:
+        next(f)  # skip header
+        reader = csv.reader(f)
+        for row in reader:
+            class_map[int(row[0])] = row[2]
+    return class_map
+
+
+def _split_weights(graph_def):
+    # Turn large constants into placeholders of the same name and type.
+    split = tf.GraphDef()
+    split.CopyFrom(graph_def)
+    weights = {}
+    for node in split.node:
+        if node.op != 'Const':
+            continue
+        value = tensor_util.MakeNdarray(node.attr['value'].tensor)
+        if value.dtype.hasobject or value.nbytes < _MIN_STORED_BYTES:
+            continue
+
+        node.op = 'Placeholder'
+        del node.attr['value']
+        node.attr['shape'].shape.CopyFrom(
+            tf.TensorShape(value.shape).as_proto())
+        weights[node.name + ':0'] = value
+    return split, weights
+
+
+def export_bundle(path, store=False):
+    """
+    Freeze checkpoints from params into a bundle
+    :param path: Output file
+    :param store: Write a weight store instead of an .npz file
+    :return:
+    """
+    graph = tf.Graph()
+    with graph.as_default(), tf.Session() as sess:
+        vggish.model.define_vggish_slim(training=False)
+        vggish.model.load_vggish_slim_checkpoint(sess, params.VGGISH_MODEL)
+        youtube_tensors = _load_youtube_inference(
+            sess, params.YOUTUBE_CHECKPOINT_FILE)
+
+        tensors = dict(zip(TENSOR_KEYS, (
+            graph.get_tensor_by_name(params.VGGISH_INPUT_TENSOR_NAME),
+            graph.get_tensor_by_name(params.VGGISH_OUTPUT_TENSOR_NAME),
+        ) + youtube_tensors))
+        outputs = [tensors[k].op.name for k in
+                   ('vggish_output', 'youtube_predictions')]
+
+        graph_def = tf.graph_util.convert_variables_to_constants(
+            sess, graph.as_graph_def(), outputs)
+
+    # Drops the training input pipeline the placeholders replaced, the
+    # graph_transforms tool isn't in the TensorFlow 1.3 package.
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, outputs)
+
+    # Sessions spend seconds on large constants in the first run, fed as
+    # placeholders the weights cost nothing there.
+    graph_def, weights = _split_weights(graph_def)
+
+    pca_params = np.load(params.VGGISH_PCA_PARAMS)
+    class_map = read_class_map()
+    indices = sorted(class_map)
+
+    arrays = dict(('weights/' + name, value)
+                  for name, value in weights.items())
+    arrays.update(
+        graph_def=np.frombuffer(graph_def.SerializeToString(), np.uint8),
+        pca_eigen_vectors=pca_params[params.PCA_EIGEN_VECTORS_NAME],
+        pca_means=pca_params[params.PCA_MEANS_NAME])
+
+    if store:
+        weight_store.write_store(path, arrays, metadata={
+            'tensors': dict((k, tensors[k].name) for k in TENSOR_KEYS),
+            'feeds': sorted(weights),
+            'class_map': [[i, class_map[i]] for i in indices],
+        })
+        return
+
+    np.savez(
+        path,
+        tensor_keys=np.array(TENSOR_KEYS),
+        tensor_names=np.array([tensors[k].name for k in TENSOR_KEYS]),
+        feed_names=np.array(sorted(weights)),
+        class_indices=np.array(indices),
+        class_names=np.array([class_map[i] for i in indices]),
+        **arrays)
+
+
+def _load_store(path):
+    # Copy-on-write, TensorFlow never writes to fed arrays so the pages stay
+    # shared between processes.
+    store = weight_store.WeightStore(path, writeable=True)
+    graph_def = tf.GraphDef()
+    graph_def.ParseFromString(store['graph_def'].tobytes())
+    metadata = store.metadata
+
+    return Bundle(graph_def=graph_def,
+                  tensors=metadata['tensors'],
+                  pca_matrix=store['pca_eigen_vectors'],
+                  pca_means=store['pca_means'].reshape(-1, 1),
+                  class_map=dict((i, n) for i, n in metadata['class_map']),
+                  feeds=dict((name, store['weights/' + name])
+                             for name in metadata['feeds']))
+
+
+def load_bundle(path):
+    """
+    Read bundle written by export_bundle
+    :param path: Bundle .npz file or weight store
+    :return: Bundle, its feeds map placeholder names in graph_def to the
+    weight arrays to feed them with
+    """
+    if weight_store.is_store(path):
+        return _load_store(path)
+
+    data = np.load(path)
+    graph_def = tf.GraphDef()
+    graph_def.ParseFromString(data['graph_def'].tobytes())
+    tensors = dict(zip((str(k) for k in data['tensor_keys']),
+                       (str(n) for n in data['tensor_names'])))
+    class_map = dict(zip((int(i) for i in data['class_indices']),
+                         (str(n) for n in data['class_names'])))
+    # Bundles written before the split keep their weights as constants.
+    feed_names = data['feed_names'] if 'feed_names' in data else []
+
+    return Bundle(graph_def=graph_def,
+                  tensors=tensors,
+                  pca_matrix=data['pca_eigen_vectors'],
+                  pca_means=data['pca_means'].reshape(-1, 1),
+                  class_map=class_map,
+                  feeds=dict((str(name), data['weights/' + str(name)])
+                             for name in feed_names))
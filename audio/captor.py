@@ -14,8 +14,10 @@
 
 import threading
 import logging.config
+import numpy as np
 
 from .device import AudioDevice
+from .ring_buffer import RingBuffer
 
 
 __all__ = ['Captor']
@@ -25,25 +27,37 @@ logger = logging.getLogger('audio_analysis.captor')
 
 class Captor(object):
     """
-    Non-blocking class to capture data from mic
+    Non-blocking class to capture data from mic or another audio source
     It waiting till "ask_data_event" is set and then call "callback" as soon as
     data ready
     """
     _sample_rate = 16000
-    _capture_rate = _sample_rate*2  # bytes per second
     _ask_data_event = None
     _shutdown_event = None
     _capture_thread = None
+    _wait_time = 0.1  # seconds, bounds shutdown delay in callback mode
 
     def __init__(self, min_time, max_time, ask_data_event, callback,
-                 shutdown_event=None):
+                 shutdown_event=None, overflow_callback=None, period=None,
+                 source=None, end_callback=None):
         """
         Init capture class
         :param min_time: Minimum capture time to process (seconds)
         :param max_time: Maximum capture time to process (seconds)
         :param ask_data_event: Event to wait data call
-        :param callback: Callable that will called with data
+        :param callback: Callable that will called with np.array of int16
+        samples
         :param shutdown_event: Event to shutdown
+        :param overflow_callback: Callable that will called right before
+        "callback" if the beginning of data was truncated, so data doesn't
+        continue previous one
+        :param period: PortAudio callback period (seconds), data is handed
+        over within a period of being asked for. None reads one second at a
+        time
+        :param source: sources.AudioSource to capture from instead of the
+        microphone, closed when capture stops
+        :param end_callback: Callable that will called after the last
+        "callback" when capture stops
         """
 
         if min_time > max_time:
@@ -52,6 +66,12 @@ class Captor(object):
         if not callable(callback):
             raise TypeError('"callback" is not callable')
 
+        if overflow_callback is not None and not callable(overflow_callback):
+            raise TypeError('"overflow_callback" is not callable')
+
+        if end_callback is not None and not callable(end_callback):
+            raise TypeError('"end_callback" is not callable')
+
         if shutdown_event is None:
             shutdown_event = threading.Event()
 
@@ -60,11 +80,15 @@ class Captor(object):
         self._ask_data_event = ask_data_event
         self._shutdown_event = shutdown_event
         self._callback = callback
+        self._overflow_callback = overflow_callback
+        self._end_callback = end_callback
+        self._period = period
+        self._source = source
 
-        self._min_data = self._min_time*self._capture_rate
-        self._max_data = self._max_time*self._capture_rate
+        self._min_data = int(self._min_time*self._sample_rate)
+        self._max_data = int(self._max_time*self._sample_rate)
 
-        self._capture_thread = threading.Thread(target=self._capture,
+        self._capture_thread = threading.Thread(target=self._run,
                                                 name='captor')
         self._capture_thread.setDaemon(True)
 
@@ -75,28 +99,62 @@ class Captor(object):
         """
         self._capture_thread.start()
 
+    def is_alive(self):
+        """
+        Check capture loop, it stops on shutdown or when the source ends
+        :return: True if capturing
+        """
+        return self._capture_thread.is_alive()
+
+    def _run(self):
+        try:
+            self._capture()
+        finally:
+            if self._end_callback is not None:
+                self._end_callback()
+
     def _capture(self):
         """
         Capture loop
         :return:
         """
-        ad = AudioDevice()
-        capture_buf = bytes()
+        if self._source is not None:
+            ad = self._source
+        elif self._period is None:
+            ad = AudioDevice(self._sample_rate)
+        else:
+            ad = AudioDevice(self._sample_rate,
+                             max(1, int(self._period*self._sample_rate)),
+                             self._max_time)
+        capture_buf = RingBuffer(self._max_data)
+        overflowed = False
 
         logger.info('Start recording.')
-        while not self._shutdown_event.is_set():
-            if self._ask_data_event.is_set() \
-                    and len(capture_buf) >= self._min_data:
-                self._callback(capture_buf)
-                capture_buf = bytes()
-
-            buf = ad.read(self._sample_rate)
-            if buf is None:
-                logger.debug('Buffer is empty.')
-                return
-            capture_buf += buf
-
-            overflow = len(capture_buf) - self._max_data
-            if overflow > 0:
-                logger.info('Buffer overflow, truncate {}b.'.format(overflow))
-                capture_buf = capture_buf[overflow:]
+        with ad:
+            while not self._shutdown_event.is_set():
+                if self._ask_data_event.is_set() \
+                        and len(capture_buf) >= self._min_data:
+                    if overflowed and self._overflow_callback is not None:
+                        self._overflow_callback()
+                    self._callback(capture_buf.read())
+                    overflowed = False
+
+                data, dropped = self._read(ad)
+                if data is None:
+                    logger.debug('Buffer is empty.')
+                    return
+
+                overflow = capture_buf.write(data) + dropped
+                if overflow > 0:
+                    logger.info('Buffer overflow, truncate {} samples.'.format(
+                        overflow))
+                    overflowed = True
+
+    def _read(self, ad):
+        if self._period is not None or self._source is not None:
+            return ad.read_available(self._wait_time)
+
+        buf = ad.read(self._sample_rate)
+        if buf is None:
+            return None, 0
+        return np.frombuffer(buf, np.int16), 0
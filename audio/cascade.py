@@ -0,0 +1,318 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Linear cascade in front of the YouTube-8M classifier.
+
+Clips are pooled to the mean and max of their PCA embeddings.  A linear
+model estimates the classifier scores of the labels it commonly reports,
+and a logistic model the probability that these estimates give the same
+top labels as the classifier.  Clips above the confidence threshold take the
+estimates, only the rest run the classifier.  Both models are fitted by
+fit_cascade.py on embeddings and scores logged with EmbeddingLog.
+"""
+
+import glob
+import os
+import time
+
+import numpy as np
+
+from . import params
+
+
+__all__ = ['LinearCascade', 'EmbeddingLog', 'pool_features',
+           'read_embedding_logs', 'top_labels', 'fit_cascade',
+           'agreement', 'choose_threshold']
+
+
+_LOG_PREFIX = 'embeddings_'
+# Scores are regressed as logits, clipped to keep them finite.
+_SCORE_EPSILON = 1e-4
+
+
+def pool_features(features_batch):
+    """
+    Summarize clips for the cascade
+    :param features_batch: List of (frames, EMBEDDING_SIZE) embeddings
+    :return: (len(features_batch), 2*EMBEDDING_SIZE) float32 array of the
+    mean and max over frames, zeros for clips without frames
+    """
+    pooled = np.zeros((len(features_batch), 2*params.EMBEDDING_SIZE),
+                      np.float32)
+    for i, features in enumerate(features_batch):
+        features = features[:params.MAX_FRAMES]
+        if features.shape[0]:
+            pooled[i, :params.EMBEDDING_SIZE] = features.mean(axis=0)
+            pooled[i, params.EMBEDDING_SIZE:] = features.max(axis=0)
+    return pooled
+
+
+def top_labels(scores, top_k):
+    """
+    Get the labels a clip is reported with
+    :param scores: (num_classes,) classifier scores
+    :param top_k: Labels compared at most
+    :return: frozenset of class indices of the top_k scores above
+    params.PREDICTIONS_HIT_LIMIT
+    """
+    top = np.argsort(-scores)[:top_k]
+    return frozenset(int(i) for i in top
+                     if scores[i] > params.PREDICTIONS_HIT_LIMIT)
+
+
+def agreement(cheap_scores, full_scores, top_k):
+    """
+    Compare estimated scores with the classifier
+    :param cheap_scores: (count, num_classes) cascade estimates
+    :param full_scores: (count, num_classes) classifier scores
+    :param top_k: Labels compared, see top_labels
+    :return: (count,) bool array, True where top labels are the same
+    """
+    return np.array([top_labels(c, top_k) == top_labels(f, top_k)
+                     for c, f in zip(cheap_scores, full_scores)], bool)
+
+
+def _sigmoid(x):
+    return 0.5 * (1 + np.tanh(0.5 * x))
+
+
+def _with_bias(x):
+    return np.hstack((x, np.ones((x.shape[0], 1), x.dtype)))
+
+
+def _fit_ridge(x, y, l2):
+    x = _with_bias(x)
+    penalty = l2 * np.eye(x.shape[1])
+    penalty[-1, -1] = 0
+    return np.linalg.solve(np.dot(x.T, x) + penalty, np.dot(x.T, y))
+
+
+def _fit_logistic(x, y, l2, iterations=25):
+    # Newton's method, the problem is small and convex.
+    x = _with_bias(x)
+    penalty = l2 * np.eye(x.shape[1])
+    penalty[-1, -1] = 0
+    w = np.zeros(x.shape[1])
+    for _ in range(iterations):
+        p = _sigmoid(np.dot(x, w))
+        gradient = np.dot(x.T, p - y) + np.dot(penalty, w)
+        hessian = np.dot(x.T * (p * (1 - p)), x) + penalty
+        step = np.linalg.solve(hessian + 1e-9 * np.eye(x.shape[1]), gradient)
+        w -= step
+        if np.abs(step).max() < 1e-6:
+            break
+    return w
+
+
+def _fit_scores(pooled, scores, classes, l2):
+    clipped = np.clip(scores[:, classes], _SCORE_EPSILON,
+                      1 - _SCORE_EPSILON)
+    return _fit_ridge(pooled, np.log(clipped / (1 - clipped)), l2)
+
+
+def _estimate_scores(pooled, classes, weights, num_classes):
+    estimates = np.zeros((pooled.shape[0], num_classes), np.float32)
+    estimates[:, classes] = _sigmoid(np.dot(_with_bias(pooled), weights))
+    return estimates
+
+
+def fit_cascade(pooled, scores, top_k=3, min_count=5, l2=1.0):
+    """
+    Fit cascade models
+    :param pooled: (count, 2*EMBEDDING_SIZE) clips, see pool_features
+    :param scores: (count, num_classes) classifier scores of the clips
+    :param top_k: Labels that have to agree, see top_labels
+    :param min_count: Clips a label has to be reported for to be estimated
+    :param l2: Regularization of both models
+    :return: (dict of arrays for LinearCascade without "threshold",
+    (count,) confidences and (count,) agreement of the clips, both from
+    models fitted without them)
+    """
+    num_classes = scores.shape[1]
+    counts = np.zeros(num_classes, np.int64)
+    for s in scores:
+        for i in top_labels(s, top_k):
+            counts[i] += 1
+    classes = np.flatnonzero(counts >= min_count)
+    if not classes.shape[0]:
+        raise ValueError('No label is reported for {} clips'.format(
+            min_count))
+
+    mean = pooled.mean(axis=0)
+    scale = pooled.std(axis=0) + 1e-6
+    x = (pooled - mean) / scale
+
+    # Agreement of each clip is measured with estimates fitted on the other
+    # half, the same clips would agree too often.
+    halves = np.arange(x.shape[0]) % 2 == 0
+    agree = np.zeros(x.shape[0], bool)
+    for half in (halves, ~halves):
+        weights = _fit_scores(x[~half], scores[~half], classes, l2)
+        estimates = _estimate_scores(x[half], classes, weights, num_classes)
+        agree[half] = agreement(estimates, scores[half], top_k)
+
+    confidence_weights = _fit_logistic(x, agree.astype(np.float64), l2)
+    model = {
+        'classes': classes,
+        'num_classes': np.array(num_classes),
+        'top_k': np.array(top_k),
+        'mean': mean.astype(np.float32),
+        'scale': scale.astype(np.float32),
+        'score_weights': _fit_scores(x, scores, classes, l2)
+        .astype(np.float32),
+        'confidence_weights': confidence_weights.astype(np.float32),
+    }
+
+    confidence = np.zeros(x.shape[0])
+    for half in (halves, ~halves):
+        w = _fit_logistic(x[~half], agree[~half].astype(np.float64), l2)
+        confidence[half] = _sigmoid(np.dot(_with_bias(x[half]), w))
+    return model, confidence, agree
+
+
+def choose_threshold(confidence, agree, min_agreement):
+    """
+    Find the lowest confidence threshold meeting an agreement target
+    :param confidence: (count,) confidences of clips
+    :param agree: (count,) bool array, True where estimates agree
+    :param min_agreement: Fraction of clips taking the cheap path that have
+    to agree with the classifier
+    :return: Threshold, above 1 if no threshold meets the target
+    """
+    order = np.argsort(-confidence)
+    agreed = np.cumsum(agree[order]) / np.arange(1, len(order) + 1)
+    # Longest prefix of the most confident clips meeting the target.
+    meets = np.flatnonzero(agreed >= min_agreement)
+    if not meets.shape[0]:
+        return 1.0 + 1e-6
+    return float(confidence[order[meets[-1]]])
+
+
+class LinearCascade(object):
+    def __init__(self, path=params.CASCADE_MODEL):
+        """
+        Load cascade
+        :param path: .npz file written by fit_cascade.py
+        """
+        arrays = np.load(path)
+        self.classes = arrays['classes']
+        self.num_classes = int(arrays['num_classes'])
+        self.top_k = int(arrays['top_k'])
+        self.threshold = float(arrays['threshold'])
+        self._mean = arrays['mean']
+        self._scale = arrays['scale']
+        self._score_weights = arrays['score_weights']
+        self._confidence_weights = arrays['confidence_weights']
+        # Clips that took each path, see predict.
+        self.cheap_count = 0
+        self.full_count = 0
+
+    def estimate(self, pooled):
+        """
+        Estimate classifier scores and their confidence
+        :param pooled: (count, 2*EMBEDDING_SIZE) clips, see pool_features
+        :return: ((count, num_classes) scores, zero for labels that aren't
+        estimated, (count,) probability of agreeing with the classifier)
+        """
+        x = (pooled - self._mean) / self._scale
+        estimates = _estimate_scores(x, self.classes, self._score_weights,
+                                     self.num_classes)
+        confidence = _sigmoid(np.dot(_with_bias(x),
+                                     self._confidence_weights))
+        return estimates, confidence
+
+    def predict(self, features_batch):
+        """
+        Decide which clips need the classifier
+        :param features_batch: List of (frames, EMBEDDING_SIZE) embeddings
+        :return: ((count, num_classes) estimated scores, (count,) bool array,
+        True for clips to take the estimates for)
+        """
+        estimates, confidence = self.estimate(pool_features(features_batch))
+        cheap = confidence >= self.threshold
+        self.cheap_count += int(cheap.sum())
+        self.full_count += int((~cheap).sum())
+        return estimates, cheap
+
+
+class EmbeddingLog(object):
+    """Writes pooled clips with classifier scores for fit_cascade.py."""
+
+    def __init__(self, directory, rows_per_file=1000):
+        """
+        Init log
+        :param directory: Existing directory, each log file gets a new name
+        :param rows_per_file: Clips buffered before a file is written
+        """
+        self._directory = directory
+        self._rows_per_file = rows_per_file
+        self._pooled = []
+        self._scores = []
+        self._rows = 0
+
+    def add(self, features_batch, scores):
+        """
+        Log clips the classifier ran for
+        :param features_batch: List of (frames, EMBEDDING_SIZE) embeddings
+        :param scores: (count, num_classes) classifier scores
+        :return:
+        """
+        self._pooled.append(pool_features(features_batch))
+        self._scores.append(np.asarray(scores, np.float32))
+        self._rows += len(features_batch)
+        if self._rows >= self._rows_per_file:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered clips
+        :return:
+        """
+        if not self._rows:
+            return
+        path = os.path.join(self._directory, '{}{:.0f}_{}.npz'.format(
+            _LOG_PREFIX, time.time() * 1000, os.getpid()))
+        np.savez(path, pooled=np.concatenate(self._pooled),
+                 scores=np.concatenate(self._scores))
+        self._pooled = []
+        self._scores = []
+        self._rows = 0
+
+    def close(self):
+        self.flush()
+
+
+def read_embedding_logs(paths):
+    """
+    Read clips written by EmbeddingLog
+    :param paths: Log files or directories of them
+    :return: (pooled, scores) arrays of all clips
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(
+                os.path.join(path, _LOG_PREFIX + '*.npz'))))
+        else:
+            files.append(path)
+
+    pooled = []
+    scores = []
+    for path in files:
+        with np.load(path) as arrays:
+            pooled.append(arrays['pooled'])
+            scores.append(arrays['scores'])
+    if not pooled:
+        raise ValueError('No embedding logs in {}'.format(paths))
+    return np.concatenate(pooled), np.concatenate(scores)
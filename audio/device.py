@@ -12,33 +12,108 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+import logging
+import numpy as np
 import pyaudio
 
+from .ring_buffer import RingBuffer
+
 
 __all__ = ['AudioDevice']
 
+logger = logging.getLogger('audio_analysis.device')
+
 
 class AudioDevice(object):
-    def __init__(self):
+    def __init__(self, sample_rate=16000, period=None, buffer_time=5,
+                 device_index=None, channels=1):
+        """
+        Open input stream
+        :param sample_rate: Capture rate
+        :param period: Frames per PortAudio callback, enables non-blocking
+        capture with read_available, None for blocking read
+        :param buffer_time: Seconds kept for read_available before the
+        oldest samples are dropped
+        :param device_index: PortAudio input device, None for the default one
+        :param channels: Channels captured, read_available returns
+        (frames, channels) arrays for more than one
+        """
+        self._sample_rate = sample_rate
+        self._period = period
+        self._channels = channels
         self.pa = pyaudio.PyAudio()
-        self.in_stream = self.pa.open(format=pyaudio.paInt16, channels=1,
-                                      rate=16000, input=True)
+        self.out_stream = None
+
+        if period is None:
+            self.in_stream = self.pa.open(
+                format=pyaudio.paInt16, channels=channels, rate=sample_rate,
+                input=True, input_device_index=device_index)
+        else:
+            self._lock = threading.Lock()
+            self._data_ready = threading.Event()
+            self._buf = RingBuffer(int(buffer_time*sample_rate), channels)
+            self._dropped = 0
+            self.in_stream = self.pa.open(
+                format=pyaudio.paInt16, channels=channels, rate=sample_rate,
+                input=True, input_device_index=device_index,
+                frames_per_buffer=period,
+                stream_callback=self._on_input)
         self.in_stream.start_stream()
-        self.out_stream = self.pa.open(format=pyaudio.paInt16, channels=1,
-                                       rate=16000, output=True)
-        self.out_stream.start_stream()
 
     def close(self):
         self.in_stream.close()
-        self.out_stream.close()
+        if self.out_stream is not None:
+            self.out_stream.close()
         self.pa.terminate()
 
+    def _on_input(self, in_data, frame_count, time_info, status):
+        # Runs on the PortAudio thread, only copies the period in.
+        samples = np.frombuffer(in_data, np.int16)
+        if self._channels > 1:
+            samples = samples.reshape(-1, self._channels)
+        with self._lock:
+            self._dropped += self._buf.write(samples)
+        self._data_ready.set()
+        if status & pyaudio.paInputOverflow:
+            logger.warning('Input overflow in PortAudio.')
+        return None, pyaudio.paContinue
+
     def write(self, b):
+        if self.out_stream is None:
+            # Opened on first use only, capture doesn't need it.
+            self.out_stream = self.pa.open(
+                format=pyaudio.paInt16, channels=1, rate=self._sample_rate,
+                output=True)
+            self.out_stream.start_stream()
         return self.out_stream.write(b)
 
     def read(self, n):
+        if self._period is not None:
+            raise RuntimeError('Device is in callback mode, use '
+                               'read_available')
         return self.in_stream.read(n)
 
+    def read_available(self, timeout=None):
+        """
+        Take samples captured since the previous call
+        :param timeout: Seconds to wait for the next period if nothing is
+        buffered, None waits forever
+        :return: (np.array of int16 samples, samples dropped since the
+        previous call), the array is None once the stream has stopped
+        """
+        if not self._data_ready.wait(timeout):
+            if not self.in_stream.is_active():
+                return None, 0
+            shape = 0 if self._channels == 1 else (0, self._channels)
+            return np.zeros(shape, np.int16), 0
+
+        with self._lock:
+            self._data_ready.clear()
+            data = self._buf.read()
+            dropped, self._dropped = self._dropped, 0
+        return data, dropped
+
     def flush(self):
         pass
 
@@ -0,0 +1,111 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Energy gate skipping inference on quiet audio.
+
+Works on the log mel examples the frontend computes anyway, so a closed gate
+costs a few operations per frame instead of a VGGish and a classifier run.
+"""
+
+import numpy as np
+
+from . import params
+
+
+__all__ = ['EnergyGate', 'example_levels', 'example_flux']
+
+# Makes white noise read as its RMS level in dBFS.
+_LEVEL_OFFSET = -33.5
+# Share of loudest frames that decides the example level, so ~100 ms events
+# open the gate while a single click doesn't.
+_LEVEL_PERCENTILE = 90
+
+
+def example_levels(examples):
+    """
+    Estimate loudness of examples
+    :param examples: (count, NUM_FRAMES, NUM_BANDS) log mel examples
+    :return: (count,) array of levels in approximate dBFS
+    """
+    magnitude = np.maximum(np.exp(examples) - params.LOG_OFFSET, 0)
+    power = np.mean(np.square(magnitude), axis=2)
+    frame_levels = 10*np.log10(power + 1e-20) + _LEVEL_OFFSET
+    return np.percentile(frame_levels, _LEVEL_PERCENTILE, axis=1)
+
+
+def example_flux(examples):
+    """
+    Measure spectral flux of examples, high for onsets and changing sounds
+    :param examples: (count, NUM_FRAMES, NUM_BANDS) log mel examples
+    :return: (count,) array of mean positive log mel change per frame
+    """
+    if examples.shape[1] < 2:
+        return np.zeros(examples.shape[0])
+    rise = np.maximum(np.diff(examples, axis=1), 0)
+    return np.mean(rise, axis=(1, 2))
+
+
+class EnergyGate(object):
+    """Decides which examples of a stream are worth classifying.
+
+    An example opens the gate when its level or its flux reaches the
+    threshold, the gate stays open for hangover examples after that, so
+    the tail of a sound is classified as well.  Holds the hangover state of
+    one stream.
+    """
+
+    def __init__(self, level=-60.0, flux=None, hangover=2):
+        """
+        Init gate
+        :param level: Level threshold in dBFS, see example_levels, None to
+        decide by flux only
+        :param flux: Flux threshold, see example_flux, None to decide by
+        level only
+        :param hangover: Examples kept open after the last loud one
+        """
+        if level is None and flux is None:
+            raise ValueError('Gate needs a level or a flux threshold')
+
+        self.level = level
+        self.flux = flux
+        self.hangover = hangover
+        self.reset()
+
+    def reset(self):
+        """
+        Close the gate, next examples start a new stream
+        :return:
+        """
+        self._remaining = 0
+
+    def __call__(self, examples):
+        """
+        Pass next examples of the stream
+        :param examples: (count, NUM_FRAMES, NUM_BANDS) log mel examples
+        :return: (count,) bool array, True for examples to classify
+        """
+        loud = np.zeros(examples.shape[0], bool)
+        if self.level is not None:
+            loud |= example_levels(examples) >= self.level
+        if self.flux is not None:
+            loud |= example_flux(examples) >= self.flux
+
+        active = loud.copy()
+        for i, is_loud in enumerate(loud):
+            if is_loud:
+                self._remaining = self.hangover
+            elif self._remaining:
+                self._remaining -= 1
+                active[i] = True
+        return active
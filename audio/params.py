@@ -16,6 +16,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
+
 # Architectural constants.
 NUM_FRAMES = 96  # Frames in input mel-spectrogram patch.
 NUM_BANDS = 64  # Frequency bands in input mel-spectrogram patch.
@@ -47,11 +50,30 @@ VGGISH_MODEL = 'models/vggish_model.ckpt'
 VGGISH_PCA_PARAMS = 'models/vggish_pca_params.npz'
 VGGISH_INPUT_TENSOR_NAME = 'vggish/input_features:0'
 VGGISH_OUTPUT_TENSOR_NAME = 'vggish/embedding:0'
+# VGGish weights for the NumPy backend, see export_weights.py.
+VGGISH_NUMPY_WEIGHTS = 'models/vggish_weights.npz'
+# Int8 VGGish weights, see calibrate_int8.py.
+VGGISH_INT8_WEIGHTS = 'models/vggish_weights_int8.npz'
 
 YOUTUBE_CHECKPOINT_FILE = 'models/youtube_model.ckpt'
 
 CLASS_LABELS_INDICES = 'models/class_labels_indices.csv'
 
+# Frozen graphs, PCA parameters and labels, see export_bundle.py.
+MODEL_BUNDLE = 'models/bundle.npz'
+# The same as a memory-mapped weight store shared by processes.
+MODEL_STORE = 'models/bundle.store'
+
+# Linear pre-classifier in front of the YouTube-8M model, see
+# fit_cascade.py.
+CASCADE_MODEL = 'models/cascade.npz'
+
+# Unix socket of the resident analyzer, see parse_file.py --serve. Kept in
+# the user's runtime directory where there is one, named per user otherwise.
+ANALYZER_SOCKET = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+    'audio_analysis-{}.sock'.format(os.getuid()))
+
 # Predictions filter
 PREDICTIONS_COUNT_LIMIT = 20
 PREDICTIONS_HIT_LIMIT = 0.1
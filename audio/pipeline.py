@@ -0,0 +1,325 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Queued analysis pipeline of capture streams.
+
+    capture -> scheduler -> feature -> queue -> inference -> queue -> sink
+
+Captors submit chunks to the InferenceScheduler and tell it when they end.
+The feature stage takes scheduled batches, updates the stream states and
+runs VGGish, the inference stage runs the cascade and classifier and the
+sink stage hands results to a callback.  Each stage has its own thread
+blocking on its input, so VGGish of one batch runs while the classifier
+works on the previous one.  Batches a queue drops are reported back to the
+scheduler and counted as dropped chunks of their streams.
+"""
+
+import os
+import re
+import threading
+import time
+import logging
+from collections import deque
+
+import numpy as np
+from scipy.io import wavfile
+
+from .predictions import QUIET
+from .scheduler import InferenceScheduler
+
+
+__all__ = ['BoundedQueue', 'Pipeline', 'OVERFLOW_POLICIES']
+
+logger = logging.getLogger('audio_analysis.pipeline')
+
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+
+def _concatenate(first, second):
+    # Items of pipeline queues are tuples of lists.
+    return tuple(a + b for a, b in zip(first, second))
+
+
+class BoundedQueue(object):
+    """FIFO between two stages with a policy for a full queue."""
+
+    def __init__(self, maxsize=2, overflow='block', merge=_concatenate,
+                 on_drop=None):
+        """
+        Init queue
+        :param maxsize: Items queued at most
+        :param overflow: What put does when full, "block" waits for the
+        consumer, "drop_oldest" drops the oldest item and "coalesce" merges
+        the new item into the newest one
+        :param merge: Callable merging two items into one for "coalesce"
+        :param on_drop: Callable called with each item dropped, by
+        "drop_oldest" or by put after close
+        """
+        if maxsize < 1:
+            raise ValueError('"maxsize" must be positive')
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy "{}"'.format(overflow))
+
+        self._items = deque()
+        self._maxsize = maxsize
+        self._overflow = overflow
+        self._merge = merge
+        self._on_drop = on_drop
+        self._closed = False
+        self._condition = threading.Condition()
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        with self._condition:
+            return len(self._items)
+
+    def put(self, item):
+        """
+        Add item, what happens when full depends on the overflow policy
+        :param item: Item, None is reserved for get
+        :return:
+        """
+        with self._condition:
+            while len(self._items) >= self._maxsize and not self._closed:
+                if self._overflow == 'block':
+                    self._condition.wait()
+                elif self._overflow == 'drop_oldest':
+                    self._drop(self._items.popleft())
+                else:
+                    item = self._merge(self._items.pop(), item)
+                    self.coalesced += 1
+
+            if self._closed:
+                self._drop(item)
+                return
+            self._items.append(item)
+            self._condition.notify_all()
+
+    def get(self):
+        """
+        Wait for the next item
+        :return: Oldest item, None once the queue is closed and empty
+        """
+        with self._condition:
+            while not self._items and not self._closed:
+                self._condition.wait()
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def close(self):
+        """
+        Let get return None after the last item, later items are dropped
+        :return:
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _drop(self, item):
+        self.dropped += 1
+        if self._on_drop is not None:
+            self._on_drop(item)
+
+
+class Pipeline(object):
+    def __init__(self, streams, sink, sample_rate=16000, hop=None,
+                 window=5, scheduler=None, queue_size=2, overflow='block',
+                 save_path=None):
+        """
+        Init pipeline
+        :param streams: List of streams.CaptureStream, added to the scheduler
+        already
+        :param sink: Callable called on the sink thread with stream,
+        end_seconds (None without hop) and predictions, predictions.QUIET
+        for audio a gate kept from the models
+        :param sample_rate: Capture rate
+        :param hop: Classify a sliding window every hop seconds instead of
+        each chunk, see WavProcessor.get_sliding_predictions
+        :param window: Sliding window length in seconds
+        :param scheduler: scheduler.InferenceScheduler the streams submit to,
+        a default one with all streams is created if not given
+        :param queue_size: Batches queued between stages at most
+        :param overflow: Policy of the queues between stages, see
+        BoundedQueue
+        :param save_path: Directory to save captured chunks to
+        """
+        if scheduler is None:
+            scheduler = InferenceScheduler()
+            for stream in streams:
+                scheduler.add_stream(stream)
+
+        self.scheduler = scheduler
+        self._streams = streams
+        self._sink = sink
+        self._sample_rate = sample_rate
+        self._hop = hop
+        self._window = window
+        self._save_path = save_path
+        # Items of both queues start with the chunks they came from.
+        self._features = BoundedQueue(queue_size, overflow,
+                                      on_drop=self._on_drop)
+        self._results = BoundedQueue(queue_size, overflow,
+                                     on_drop=self._on_drop)
+        self._proc = None
+
+    def run(self, proc):
+        """
+        Start capture and stages, return when stopped or all sources ended
+        and queued audio is processed
+        :param proc: WavProcessor or GraphProcessor, stage threads are
+        started here and inherit CPU affinity of the calling thread
+        :return:
+        """
+        self._proc = proc
+        for stream in self._streams:
+            if self._hop:
+                state = proc.create_sliding_stream(
+                    self._sample_rate, self._window, self._hop)
+            else:
+                state = proc.create_stream(self._sample_rate)
+            logger.info('Start captor of "{}".'.format(stream.name))
+            stream.start(state, self.scheduler)
+
+        threads = [
+            threading.Thread(target=self._run_stage, name=name,
+                             args=(target,))
+            for name, target in (('features', self._feature_loop),
+                                 ('inference', self._inference_loop),
+                                 ('sink', self._sink_loop))]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        """
+        Stop taking chunks, batches already taken are processed
+        :return:
+        """
+        self.scheduler.close()
+
+    def stats(self):
+        """
+        Get counters
+        :return: Dict of "streams", see InferenceScheduler.stats, and
+        "queues", items "queued", "dropped" and "coalesced" between stages
+        """
+        return {
+            'streams': self.scheduler.stats(),
+            'queues': dict((name, {'queued': len(queue),
+                                   'dropped': queue.dropped,
+                                   'coalesced': queue.coalesced})
+                           for name, queue in (('features', self._features),
+                                               ('results', self._results))),
+        }
+
+    def _run_stage(self, target):
+        try:
+            target()
+        except Exception:
+            logger.exception('Pipeline stage failed.')
+            self.stop()
+            # Stages after this one finish, earlier ones drop their output.
+            self._features.close()
+            self._results.close()
+
+    def _feature_loop(self):
+        while True:
+            # Empty once stopped or all captors ended, and nothing is queued.
+            batch = self.scheduler.next_batch()
+            if not batch:
+                break
+            self._features.put(self._extract(batch))
+        self._features.close()
+
+    def _inference_loop(self):
+        while True:
+            item = self._features.get()
+            if item is None:
+                break
+            self._results.put(self._infer(*item))
+        self._results.close()
+
+    def _sink_loop(self):
+        while True:
+            item = self._results.get()
+            if item is None:
+                break
+            chunks, results = item
+            for stream, end, predictions in results:
+                self._sink(stream, end, predictions)
+            self.scheduler.done(chunks)
+
+    def _on_drop(self, item):
+        self.scheduler.drop(item[0])
+
+    def _extract(self, batch):
+        """
+        Feature stage
+        :param batch: List of scheduler.Chunk
+        :return: (chunks, jobs), jobs are (stream, end_seconds, embeddings)
+        with embeddings None if no example was completed or QUIET
+        """
+        for chunk in batch:
+            if chunk.reset:
+                chunk.stream.reset()
+            if self._save_path:
+                self._save(chunk.stream, chunk.data)
+
+        chunks = [(c.stream.state, c.data) for c in batch]
+        gates = [c.stream.gate for c in batch]
+        jobs = []
+        if self._hop:
+            windows = self._proc.get_sliding_features_batch(chunks,
+                                                           gates=gates)
+            for chunk, stream_windows in zip(batch, windows):
+                jobs.extend((chunk.stream, end, f)
+                            for end, f in stream_windows)
+        else:
+            features = self._proc.get_stream_features_batch(chunks, gates)
+            jobs.extend((c.stream, None, f) for c, f in zip(batch, features))
+        return batch, jobs
+
+    def _infer(self, chunks, jobs):
+        """
+        Inference stage
+        :param chunks: Chunks the jobs came from
+        :param jobs: See _extract
+        :return: (chunks, results), results are (stream, end_seconds,
+        predictions)
+        """
+        ready = [f for _, _, f in jobs if isinstance(f, np.ndarray)]
+        predictions = iter(self._proc.classify(ready))
+        results = []
+        for stream, end, f in jobs:
+            if isinstance(f, np.ndarray):
+                results.append((stream, end, next(predictions)))
+            else:
+                results.append((stream, end, QUIET if f is QUIET else []))
+        return chunks, results
+
+    def _save(self, stream, data):
+        f_name = 'record_{:.0f}.wav'.format(time.time())
+        if len(self._streams) > 1:
+            f_name = '{}_{}'.format(re.sub(r'[^\w.-]', '_', stream.name),
+                                    f_name)
+        f_path = os.path.join(self._save_path, f_name)
+        wavfile.write(f_path, self._sample_rate, data)
+        logger.info('"{}" saved.'.format(f_path))
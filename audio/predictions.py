@@ -0,0 +1,24 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Reported instead of predictions for audio a gate kept from the models,
+# see gate.EnergyGate.
+QUIET = 'quiet'
+
+
+def format_predictions(predictions):
+    if predictions == QUIET:
+        return QUIET
+    return ', '.join('{0}: {1:.2f}'.format(*p) for p in predictions)
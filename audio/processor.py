@@ -12,38 +12,147 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import csv
 import os
+import time
+import logging
+from functools import partial
 import numpy as np
 import tensorflow as tf
 
 from . import params
-from .utils import vggish, youtube8m
+from .bundle import load_bundle, read_class_map
+from .cascade import EmbeddingLog, LinearCascade
+from .predictions import QUIET, format_predictions
+from .sliding import SlidingStream, seconds_to_examples
+from .utils import resample, vggish, youtube8m
 
 
-__all__ = ['WavProcessor', 'format_predictions']
+__all__ = ['WavProcessor', 'GraphProcessor', 'format_predictions',
+           'session_config', 'pin_cpus']
+
+logger = logging.getLogger('audio_analysis.processor')
+
+# Weights of VGGish backends running outside TensorFlow.
+NUMPY_BACKEND_WEIGHTS = {
+    'numpy': params.VGGISH_NUMPY_WEIGHTS,
+    'int8': params.VGGISH_INT8_WEIGHTS,
+}
 
 
 cwd = os.path.dirname(os.path.realpath(__file__))
 
 
-def format_predictions(predictions):
-    return ', '.join('{0}: {1:.2f}'.format(*p) for p in predictions)
+def session_config(intra_op_threads=0, inter_op_threads=0, shared_pool=True):
+    """
+    Build TensorFlow session config
+    :param intra_op_threads: Threads inside one op, 0 lets TensorFlow decide
+    :param inter_op_threads: Ops run in parallel, 0 lets TensorFlow decide
+    :param shared_pool: Run all sessions of the process on one pair of pools,
+    sized by the first session created. Otherwise every session gets its own
+    pools of the given sizes
+    :return: tf.ConfigProto
+    """
+    return tf.ConfigProto(
+        intra_op_parallelism_threads=intra_op_threads,
+        inter_op_parallelism_threads=inter_op_threads,
+        use_per_session_threads=not shared_pool)
+
+
+def pin_cpus(cpus):
+    """
+    Pin calling thread, and threads it starts afterwards, to CPUs
+    :param cpus: Iterable of CPU indices
+    :return:
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        raise OSError('CPU pinning is not supported on this platform')
+
+    os.sched_setaffinity(0, set(cpus))
+    logger.info('Pinned to CPUs {}'.format(sorted(cpus)))
+
+
+def _make_callable(sess, fetch, feed_list, weights):
+    # Weights kept outside the graph lead the feed list and are bound once.
+    # They are fed on every call, TensorFlow wraps writeable arrays without
+    # copying but copies read-only ones, see bundle._load_store.
+    if not weights:
+        return sess.make_callable(fetch, feed_list=feed_list)
+
+    tensors, arrays = zip(*weights)
+    run = sess.make_callable(fetch, feed_list=list(tensors) + feed_list)
+    return partial(run, *arrays)
 
 
 class WavProcessor(object):
     _class_map = {}
     _vggish_sess = None
     _youtube_sess = None
-
-    def __init__(self):
-        pca_params = np.load(params.VGGISH_PCA_PARAMS)
-        self._pca_matrix = pca_params[params.PCA_EIGEN_VECTORS_NAME]
-        self._pca_means = pca_params[params.PCA_MEANS_NAME].reshape(-1, 1)
-
-        self._init_vggish()
-        self._init_youtube()
-        self._init_class_map()
+    _vggish_tensors = None
+    _vggish_weights = ()
+    _youtube_weights = ()
+    _start_time = None
+    _quiet_features = None  # embedding of digital silence, see _fill_quiet
+    _cascade = None
+    _embedding_log = None
+    _pad_buf = np.zeros((0, 0, params.EMBEDDING_SIZE), np.float32)
+    _pad_used = np.zeros(0, np.int64)
+
+    def __init__(self, dtype=np.float64, bundle=params.MODEL_BUNDLE,
+                 config=None, cpus=None, vggish_backend='tf',
+                 vggish_weights=None, cascade=None, embedding_log=None):
+        """
+        Init processor
+        :param dtype: Precision of the feature frontend, np.float32 halves its
+        memory traffic, see vggish.frontend.FLOAT32_LOG_MEL_TOLERANCE
+        :param bundle: Frozen model bundle or weight store, checkpoints from
+        params are used if it doesn't exist
+        :param config: tf.ConfigProto for sessions, see session_config
+        :param cpus: CPUs to pin the calling thread and session pools to
+        :param vggish_backend: 'tf', 'numpy' or 'int8', the latter two run
+        VGGish from NUMPY_BACKEND_WEIGHTS without a TensorFlow session, see
+        vggish.numpy_model.EMBEDDING_TOLERANCE and calibrate_int8.py
+        :param vggish_weights: Weights file of a NumPy backend instead of the
+        one from NUMPY_BACKEND_WEIGHTS
+        :param cascade: Linear pre-classifier from fit_cascade.py, clips it
+        is confident about skip the YouTube-8M model
+        :param embedding_log: Directory to log clips and classifier scores
+        to, for fit_cascade.py
+        """
+        if vggish_backend != 'tf' and \
+                vggish_backend not in NUMPY_BACKEND_WEIGHTS:
+            raise ValueError(
+                'Unknown VGGish backend "{}"'.format(vggish_backend))
+        with_vggish = vggish_backend == 'tf'
+
+        self._start_time = time.time()
+        self._init_threading(config, cpus)
+        self._dtype = np.dtype(dtype)
+        self._frontend = vggish.frontend.FrontendPlan(self._dtype)
+
+        if bundle and os.path.exists(bundle):
+            self._init_bundle(bundle, with_vggish)
+            source = bundle
+        else:
+            self._init_pca()
+            if with_vggish:
+                self._init_vggish()
+            self._init_youtube()
+            self._init_class_map()
+            source = 'checkpoints'
+
+        self._compile()
+        if not with_vggish:
+            weights_path = vggish_weights or \
+                NUMPY_BACKEND_WEIGHTS[vggish_backend]
+            self._run_vggish = vggish.numpy_model.NumpyVGGish(weights_path)
+            source += ' and ' + weights_path
+        if cascade:
+            self._cascade = LinearCascade(cascade)
+            source += ' and ' + cascade
+        if embedding_log:
+            self._embedding_log = EmbeddingLog(embedding_log)
+        logger.info('Models loaded from {} in {:.2f}s'.format(
+            source, time.time() - self._start_time))
 
     def __enter__(self):
         return self
@@ -52,87 +161,560 @@ class WavProcessor(object):
         self.close()
 
     def close(self):
+        if self._cascade is not None:
+            logger.info('Cascade answered {} clips, classifier {}'.format(
+                self._cascade.cheap_count, self._cascade.full_count))
+        if self._embedding_log is not None:
+            self._embedding_log.close()
+
         if self._vggish_sess:
             self._vggish_sess.close()
 
-        if self._youtube_sess:
+        if self._youtube_sess and self._youtube_sess is not self._vggish_sess:
             self._youtube_sess.close()
 
+    def _init_threading(self, config, cpus):
+        # Pools are started with the first session and inherit affinity.
+        if cpus:
+            pin_cpus(cpus)
+        self._session_config = config
+
+    def _init_bundle(self, path, with_vggish=True):
+        bundle = load_bundle(path)
+        self._pca_matrix = bundle.pca_matrix
+        self._pca_means = bundle.pca_means
+        self._class_map.update(bundle.class_map)
+
+        graph_def = bundle.graph_def
+        if not with_vggish:
+            # Keep the classifier only, VGGish runs outside TensorFlow.
+            graph_def = tf.graph_util.extract_sub_graph(
+                graph_def,
+                [bundle.tensors['youtube_predictions'].split(':')[0]])
+
+        graph = tf.Graph()
+        with graph.as_default():
+            sess = tf.Session(config=self._session_config)
+            tf.import_graph_def(graph_def, name='')
+
+        def model_weights(output):
+            # Store arrays feeding the placeholders of one model.
+            nodes = set(node.name for node in tf.graph_util.extract_sub_graph(
+                graph_def, [bundle.tensors[output].split(':')[0]]).node)
+            return [(graph.get_tensor_by_name(name), value)
+                    for name, value in sorted(bundle.feeds.items())
+                    if name.split(':')[0] in nodes]
+
+        tensors = dict((k, graph.get_tensor_by_name(n))
+                       for k, n in bundle.tensors.items()
+                       if with_vggish or k.startswith('youtube_'))
+        self._youtube_tensors = (tensors['youtube_input'],
+                                 tensors['youtube_num_frames'],
+                                 tensors['youtube_predictions'])
+        self._youtube_sess = sess
+        if bundle.feeds:
+            self._youtube_weights = model_weights('youtube_predictions')
+        if with_vggish:
+            # Both models live in one graph.
+            self._vggish_tensors = (tensors['vggish_input'],
+                                    tensors['vggish_output'])
+            self._vggish_sess = sess
+            if bundle.feeds:
+                self._vggish_weights = model_weights('vggish_output')
+
+    def _compile(self):
+        # Resolve fetches and feeds once.  With a feed list TensorFlow 1.3
+        # callables still build a feed dict and go through sess.run, so they
+        # only save the tensor lookups, not the feed processing.
+        if self._vggish_tensors is not None:
+            features_tensor, embedding_tensor = self._vggish_tensors
+            self._run_vggish = _make_callable(
+                self._vggish_sess, embedding_tensor, [features_tensor],
+                self._vggish_weights)
+
+        input_tensor, num_frames_tensor, predictions_tensor = \
+            self._youtube_tensors
+        self._run_youtube = _make_callable(
+            self._youtube_sess, predictions_tensor,
+            [input_tensor, num_frames_tensor], self._youtube_weights)
+        # Static frame dimension of the classifier input, None if open.
+        self._youtube_width = input_tensor.get_shape().as_list()[1]
+
+    def _init_pca(self):
+        pca_params = np.load(params.VGGISH_PCA_PARAMS)
+        self._pca_matrix = pca_params[params.PCA_EIGEN_VECTORS_NAME]
+        self._pca_means = pca_params[params.PCA_MEANS_NAME].reshape(-1, 1)
+
     def _init_vggish(self):
         graph = tf.Graph()
         with graph.as_default():
-            sess = tf.Session()
+            sess = tf.Session(config=self._session_config)
             vggish.model.define_vggish_slim(training=False)
             vggish.model.load_vggish_slim_checkpoint(sess, params.VGGISH_MODEL)
 
+        self._vggish_tensors = (
+            graph.get_tensor_by_name(params.VGGISH_INPUT_TENSOR_NAME),
+            graph.get_tensor_by_name(params.VGGISH_OUTPUT_TENSOR_NAME))
         self._vggish_sess = sess
 
     def _init_youtube(self):
         graph = tf.Graph()
         with graph.as_default():
-            sess = tf.Session()
+            sess = tf.Session(config=self._session_config)
             youtube8m.model.load_model(sess, params.YOUTUBE_CHECKPOINT_FILE)
 
+        self._youtube_tensors = (
+            graph.get_collection("input_batch_raw")[0],
+            graph.get_collection("num_frames")[0],
+            graph.get_collection("predictions")[0])
         self._youtube_sess = sess
 
     def _init_class_map(self):
-        with open(params.CLASS_LABELS_INDICES) as f:
-            next(f)  # skip header
-            reader = csv.reader(f)
-            for row in reader:
-                self._class_map[int(row[0])] = row[2]
+        self._class_map.update(read_class_map())
 
     def get_predictions(self, sample_rate, data):
-        samples = data / 32768.0  # Convert to [-1.0, +1.0]
-        examples_batch = vggish.input.waveform_to_examples(samples, sample_rate)
-        features = self._get_features(examples_batch)
-        predictions = self._process_features(features)
-        predictions = self._filter_predictions(predictions)
-        return predictions
+        samples = self._to_float(data)
+        examples_batch = vggish.input.waveform_to_examples(
+            samples, sample_rate, self._frontend)
+        return self._predict(examples_batch)
+
+    def get_predictions_batch(self, clips):
+        """
+        Process many clips with one VGGish and one classifier run
+        :param clips: Iterable of (sample_rate, data) pairs, all examples are
+        held in memory at once, so pass archives in slices
+        :return: List of predictions, one per clip
+        """
+        examples = []
+        for sample_rate, data in clips:
+            examples_batch = vggish.input.waveform_to_examples(
+                self._to_float(data), sample_rate, self._frontend)
+            # Copy out of the frontend buffer before the next clip.
+            examples.append(np.array(examples_batch))
+
+        if not examples:
+            return []
+        return self._predict_batch(examples)
+
+    def get_stream_predictions(self, stream, data):
+        """
+        Process next chunk of continuous audio
+        :param stream: vggish.input.StreamingFrontend holding the stream state
+        :param data: np.array of int16 samples following the previous chunk
+        :return: Predictions for examples completed by this chunk
+        """
+        return self.get_stream_predictions_batch([(stream, data)])[0]
+
+    def get_stream_predictions_batch(self, chunks, gates=None):
+        """
+        Process next chunks of several streams with one VGGish and one
+        classifier run
+        :param chunks: List of (stream, data) pairs as for
+        get_stream_predictions, each stream at most once
+        :param gates: List of gate.EnergyGate or None per chunk, a chunk is
+        classified only if one of its examples passes
+        :return: List of predictions, one per chunk, predictions.QUIET for
+        chunks kept from the models
+        """
+        features = self.get_stream_features_batch(chunks, gates)
+        ready = [i for i, f in enumerate(features)
+                 if f is not None and f is not QUIET]
+        results = [QUIET if f is QUIET else [] for f in features]
+        for i, p in zip(ready, self.classify([features[i] for i in ready])):
+            results[i] = p
+        return results
+
+    def get_stream_features_batch(self, chunks, gates=None):
+        """
+        Run the feature part of get_stream_predictions_batch, see classify
+        for the rest
+        :param chunks: List of (stream, data) pairs as for
+        get_stream_predictions, each stream at most once
+        :param gates: List of gate.EnergyGate or None per chunk
+        :return: List of (examples, EMBEDDING_SIZE) embeddings per chunk,
+        None if the chunk completed no example, predictions.QUIET if the
+        gate kept it from the models
+        """
+        examples = [stream.push(self._to_float(data))
+                    for stream, data in chunks]
+        gates = gates or [None]*len(chunks)
+        features = [None]*len(chunks)
+        ready = []
+        for i, (e, gate) in enumerate(zip(examples, gates)):
+            if not e.shape[0]:
+                continue
+            if gate is not None and not gate(e).any():
+                features[i] = QUIET
+            else:
+                ready.append(i)
+
+        if ready:
+            counts = [examples[i].shape[0] for i in ready]
+            embeddings = self._get_features(
+                np.concatenate([examples[i] for i in ready]))
+            for i, f in zip(ready, np.split(embeddings,
+                                            np.cumsum(counts)[:-1])):
+                features[i] = f
+        return features
+
+    def get_sliding_predictions(self, stream, data, flush=False):
+        """
+        Process next chunk of continuous audio in sliding-window mode
+        :param stream: SlidingStream from create_sliding_stream
+        :param data: np.array of int16 samples following the previous chunk
+        :param flush: Last chunk of the stream, also classify the examples
+        after the last hop
+        :return: List of (end_seconds, predictions), one per hop completed
+        by this chunk, end_seconds is the stream time the window ends at
+        """
+        return self.get_sliding_predictions_batch([(stream, data)], flush)[0]
+
+    def get_sliding_predictions_batch(self, chunks, flush=False,
+                                      gates=None):
+        """
+        Process next chunks of several streams in sliding-window mode with
+        one VGGish and one classifier run
+        :param chunks: List of (stream, data) pairs as for
+        get_sliding_predictions, each stream at most once
+        :param flush: Last chunks of the streams, see get_sliding_predictions
+        :param gates: List of gate.EnergyGate or None per chunk, examples
+        kept from VGGish count as digital silence, windows without an
+        example that passed aren't classified
+        :return: List of (end_seconds, predictions) lists, one per chunk,
+        predictions are predictions.QUIET for windows kept from the
+        classifier
+        """
+        windows = self.get_sliding_features_batch(chunks, flush, gates)
+        predictions = iter(self.classify(
+            [f for stream_windows in windows for _, f in stream_windows
+             if f is not QUIET]))
+        return [[(end, QUIET if f is QUIET else next(predictions))
+                 for end, f in stream_windows]
+                for stream_windows in windows]
+
+    def get_sliding_features_batch(self, chunks, flush=False, gates=None):
+        """
+        Run the feature part of get_sliding_predictions_batch, see classify
+        for the rest
+        :param chunks: List of (stream, data) pairs as for
+        get_sliding_predictions, each stream at most once
+        :param flush: Last chunks of the streams, see get_sliding_predictions
+        :param gates: List of gate.EnergyGate or None per chunk
+        :return: List of (end_seconds, embeddings) lists, one per chunk,
+        embeddings of a window are predictions.QUIET if the gate kept it
+        from the classifier
+        """
+        examples = []
+        actives = []
+        for (stream, data), gate in zip(chunks, gates or [None]*len(chunks)):
+            examples_batch = stream.push(self._to_float(data))
+            active = np.ones(examples_batch.shape[0], bool)
+            if gate is not None and examples_batch.shape[0]:
+                active = gate(examples_batch)
+            examples.append(examples_batch[active])
+            actives.append(active)
+
+        counts = [e.shape[0] for e in examples]
+        if sum(counts):
+            # VGGish runs only on new examples, earlier ones come from cache.
+            features = self._get_features(np.concatenate(examples))
+        else:
+            features = np.zeros((0, params.EMBEDDING_SIZE), np.float32)
+        features_batch = np.split(features, np.cumsum(counts)[:-1])
+
+        windows = []
+        for (stream, _), f, active in zip(chunks, features_batch, actives):
+            if not active.all():
+                f = self._fill_quiet(f, active)
+            stream_windows = []
+            if active.shape[0] or flush:
+                stream_windows = stream.add(f, flush, active)
+            windows.append([(end*params.EXAMPLE_HOP_SECONDS,
+                             w if is_active else QUIET)
+                            for end, w, is_active in stream_windows])
+        return windows
+
+    def _fill_quiet(self, features, active):
+        """
+        Give examples kept from VGGish the embedding of digital silence
+        :param features: Embeddings of the active examples
+        :param active: Bool array per example
+        :return: Embeddings of all examples
+        """
+        if self._quiet_features is None:
+            silence = np.full((1, params.NUM_FRAMES, params.NUM_BANDS),
+                              np.log(params.LOG_OFFSET), np.float32)
+            self._quiet_features = self._get_features(silence)[0]
+
+        filled = np.empty((active.shape[0], params.EMBEDDING_SIZE),
+                          features.dtype)
+        filled[active] = features
+        filled[~active] = self._quiet_features
+        return filled
+
+    def create_sliding_stream(self, sample_rate, window_seconds,
+                              hop_seconds):
+        """
+        Create stream state for get_sliding_predictions
+        :param sample_rate: Sample rate of stream data
+        :param window_seconds: Audio classified at a time, rounded to whole
+        examples
+        :param hop_seconds: Time between classifications, rounded to whole
+        examples
+        :return: SlidingStream
+        """
+        return SlidingStream(self.create_stream(sample_rate),
+                             seconds_to_examples(window_seconds),
+                             seconds_to_examples(hop_seconds))
+
+    def create_stream(self, sample_rate):
+        """
+        Create stream state for get_stream_predictions
+        :param sample_rate: Sample rate of stream data
+        :return: vggish.input.StreamingFrontend with processor precision
+        """
+        plan = vggish.frontend.FrontendPlan(self._dtype)
+        return vggish.input.StreamingFrontend(sample_rate, plan)
+
+    def _to_float(self, data):
+        # Convert to [-1.0, +1.0], scaling by a power of two is exact.
+        return np.multiply(data, self._dtype.type(1.0 / 32768),
+                           dtype=self._dtype)
+
+    def _predict(self, examples_batch):
+        return self._predict_batch([examples_batch])[0]
+
+    def _predict_batch(self, examples):
+        counts = [e.shape[0] for e in examples]
+        features = self._get_features(np.concatenate(examples))
+        features_batch = np.split(features, np.cumsum(counts)[:-1])
+        return self.classify(features_batch)
+
+    def classify(self, features_batch):
+        """
+        Run the cascade, if any, and the classifier for the rest
+        :param features_batch: List of (frames, EMBEDDING_SIZE) embeddings,
+        e.g. from get_stream_features_batch
+        :return: List of filtered predictions, one per clip
+        """
+        if not features_batch:
+            return []
+
+        full = list(range(len(features_batch)))
+        results = [None] * len(features_batch)
+        if self._cascade is not None:
+            estimates, cheap = self._cascade.predict(features_batch)
+            for i in np.flatnonzero(cheap):
+                results[i] = self._filter_predictions(estimates[i])
+            full = np.flatnonzero(~cheap)
+
+        if len(full):
+            full_batch = [features_batch[i] for i in full]
+            predictions = self._process_features(full_batch)
+            if self._embedding_log is not None:
+                self._embedding_log.add(full_batch, predictions)
+            for i, p in zip(full, predictions):
+                results[i] = self._filter_predictions(p)
+
+        self._log_first_prediction()
+        return results
+
+    def _log_first_prediction(self):
+        if self._start_time is not None:
+            logger.info('First prediction {:.2f}s after start'.format(
+                time.time() - self._start_time))
+            self._start_time = None
 
     def _filter_predictions(self, predictions):
         count = params.PREDICTIONS_COUNT_LIMIT
         hit = params.PREDICTIONS_HIT_LIMIT
 
-        top_indices = np.argpartition(predictions[0], -count)[-count:]
-        line = ((self._class_map[i], float(predictions[0][i])) for
-                i in top_indices if predictions[0][i] > hit)
+        top_indices = np.argpartition(predictions, -count)[-count:]
+        line = ((self._class_map[i], float(predictions[i])) for
+                i in top_indices if predictions[i] > hit)
         return sorted(line, key=lambda p: -p[1])
 
-    def _process_features(self, features):
-        sess = self._youtube_sess
-        num_frames = np.minimum(features.shape[0], params.MAX_FRAMES)
-        data = youtube8m.input.resize(features, 0, params.MAX_FRAMES)
-        data = np.expand_dims(data, 0)
-        num_frames = np.expand_dims(num_frames, 0)
-
-        input_tensor = sess.graph.get_collection("input_batch_raw")[0]
-        num_frames_tensor = sess.graph.get_collection("num_frames")[0]
-        predictions_tensor = sess.graph.get_collection("predictions")[0]
-
-        predictions_val, = sess.run(
-            [predictions_tensor],
-            feed_dict={
-                input_tensor: data,
-                num_frames_tensor: num_frames
-            })
-
-        return predictions_val
+    def _pad_features(self, features_batch, width):
+        """
+        Copy clips into the reused classifier input buffer
+        :param features_batch: List of (frames, EMBEDDING_SIZE) arrays
+        :param width: Frames per clip in the batch
+        :return: (len(features_batch), width, EMBEDDING_SIZE) float32 view
+        """
+        batch_size = len(features_batch)
+        if self._pad_buf.shape[0] < batch_size or \
+                self._pad_buf.shape[1] < width:
+            self._pad_buf = np.zeros(
+                (max(batch_size, self._pad_buf.shape[0]),
+                 max(width, self._pad_buf.shape[1]),
+                 params.EMBEDDING_SIZE), np.float32)
+            self._pad_used = np.zeros(self._pad_buf.shape[0], np.int64)
+
+        data = self._pad_buf[:batch_size, :width]
+        for i, features in enumerate(features_batch):
+            count = min(features.shape[0], width)
+            data[i, :count] = features[:count]
+            # Only rows written by earlier calls need zeroing.
+            dirty = self._pad_used[i]
+            data[i, count:dirty] = 0
+            self._pad_used[i] = count if dirty <= width else dirty
+        return data
+
+    def _process_features(self, features_batch):
+        num_frames = np.array([np.minimum(f.shape[0], params.MAX_FRAMES)
+                               for f in features_batch], np.int32)
+
+        # Models with an open frame dimension get only the real frames.
+        width = self._youtube_width or max(max(num_frames), 1)
+        data = self._pad_features(features_batch, width)
+        return self._run_youtube(data, num_frames)
 
     def _get_features(self, examples_batch):
-        sess = self._vggish_sess
-        features_tensor = sess.graph.get_tensor_by_name(
-            params.VGGISH_INPUT_TENSOR_NAME)
-        embedding_tensor = sess.graph.get_tensor_by_name(
-            params.VGGISH_OUTPUT_TENSOR_NAME)
-
-        [embedding_batch] = sess.run(
-            [embedding_tensor],
-            feed_dict={features_tensor: examples_batch}
-        )
+        embedding_batch = self._run_vggish(
+            examples_batch.astype(np.float32, copy=False))
 
         postprocessed_batch = np.dot(
             self._pca_matrix, (embedding_batch.T - self._pca_means)
         ).T
 
         return postprocessed_batch
+
+
+def _gather_frames(data, window_length, hop_length):
+    # Graph version of mel_features.frame.
+    num_frames = tf.maximum(
+        0, 1 + (tf.shape(data)[0] - window_length) // hop_length)
+    indices = tf.expand_dims(tf.range(num_frames) * hop_length, 1) + \
+        tf.expand_dims(tf.range(window_length), 0)
+    return tf.gather(data, indices)
+
+
+def _graph_examples(samples, plan):
+    # Graph version of FrontendPlan.log_mel_spectrogram followed by framing
+    # into examples, using the plan's window and mel matrix.
+    frames = _gather_frames(samples, plan.window_length, plan.hop_length)
+    windowed = tf.pad(frames * plan.window,
+                      [[0, 0], [0, plan.fft_length - plan.window_length]])
+    magnitude = tf.abs(tf.spectral.rfft(windowed, [plan.fft_length]))
+    magnitude = magnitude[:, plan.bins.start:plan.bins.stop]
+    mel = tf.matmul(magnitude, plan.mel_matrix)
+    log_mel = tf.log(mel + params.LOG_OFFSET)
+
+    window_length, hop_length = vggish.input.example_lengths()
+    examples = _gather_frames(log_mel, window_length, hop_length)
+    return tf.reshape(examples, [-1, params.NUM_FRAMES, params.NUM_BANDS])
+
+
+class GraphProcessor(WavProcessor):
+    """
+    Processor that runs the whole inference as one graph
+
+    Int16 PCM goes in and scores come out of a single sess.run: log mel
+    frontend, VGGish, PCA, padding and the classifier are all graph ops built
+    around the frozen model bundle, so nothing crosses back to NumPy in
+    between.  The frontend runs in float32, FFT included: log mel values
+    stay within 1e-3 of WavProcessor on recordings and noise, but move up
+    to 0.025, past FLOAT32_LOG_MEL_TOLERANCE, in the leakage bands of
+    full-scale pure tones.  Batch and stream methods work as in
+    WavProcessor, feeding the intermediate tensors.
+    """
+
+    def __init__(self, bundle=params.MODEL_BUNDLE, config=None, cpus=None):
+        """
+        Init processor
+        :param bundle: Frozen model bundle or weight store, see
+        export_bundle.py
+        :param config: tf.ConfigProto for the session, see session_config
+        :param cpus: CPUs to pin the calling thread and session pools to
+        """
+        if not os.path.exists(bundle):
+            raise FileNotFoundError(
+                '"{}" doesn\'t exist, run export_bundle.py'.format(bundle))
+
+        self._start_time = time.time()
+        self._init_threading(config, cpus)
+        self._dtype = np.dtype(np.float32)
+        self._frontend = vggish.frontend.FrontendPlan(self._dtype)
+
+        bundle_data = load_bundle(bundle)
+        self._pca_matrix = bundle_data.pca_matrix
+        self._pca_means = bundle_data.pca_means
+        self._class_map.update(bundle_data.class_map)
+
+        graph = tf.Graph()
+        with graph.as_default():
+            self._init_graph(bundle_data)
+            sess = tf.Session(config=self._session_config)
+
+        self._vggish_sess = self._youtube_sess = sess
+        self._compile()
+        weights = self._vggish_weights + self._youtube_weights
+        self._run_pcm = _make_callable(
+            sess, self._predictions, [self._pcm], weights)
+        self._run_samples = _make_callable(
+            sess, self._predictions, [self._samples], weights)
+        logger.info('Graph built from {} in {:.2f}s'.format(
+            bundle, time.time() - self._start_time))
+
+    def _init_graph(self, bundle_data):
+        tensors = bundle_data.tensors
+
+        def import_part(output, input_map):
+            # Output tensor and the weights to feed its placeholders with.
+            graph_def = tf.graph_util.extract_sub_graph(
+                bundle_data.graph_def, [tensors[output].split(':')[0]])
+            tensor = tf.import_graph_def(
+                graph_def, input_map=input_map,
+                return_elements=[tensors[output]], name=output)[0]
+            nodes = set(node.name for node in graph_def.node)
+            weights = [(tensor.graph.get_tensor_by_name(
+                            '{}/{}'.format(output, name)), value)
+                       for name, value in sorted(bundle_data.feeds.items())
+                       if name.split(':')[0] in nodes]
+            return tensor, weights
+
+        self._pcm = tf.placeholder(tf.int16, shape=(None,), name='pcm')
+        self._samples = tf.cast(self._pcm, tf.float32) / 32768.0
+        examples = _graph_examples(self._samples, self._frontend)
+
+        embeddings, self._vggish_weights = import_part(
+            'vggish_output', {tensors['vggish_input']: examples})
+        features = tf.matmul(
+            embeddings - self._pca_means.reshape(1, -1).astype(np.float32),
+            self._pca_matrix.astype(np.float32), transpose_b=True)
+
+        num_frames = tf.minimum(tf.shape(features)[0], params.MAX_FRAMES)
+        features = features[:params.MAX_FRAMES]
+        padded = tf.pad(features,
+                        [[0, params.MAX_FRAMES - num_frames], [0, 0]])
+        # Defaults keep the batch dimension open for feeding many clips.
+        padded = tf.placeholder_with_default(
+            tf.expand_dims(padded, 0),
+            shape=(None, params.MAX_FRAMES, params.EMBEDDING_SIZE))
+        num_frames = tf.placeholder_with_default(
+            tf.expand_dims(num_frames, 0), shape=(None,))
+
+        self._predictions, self._youtube_weights = import_part(
+            'youtube_predictions', {
+                tensors['youtube_input']: padded,
+                tensors['youtube_num_frames']: num_frames,
+            })
+
+        # Entry points for the inherited batch and stream methods.
+        self._vggish_tensors = (examples, embeddings)
+        self._youtube_tensors = (padded, num_frames, self._predictions)
+
+    def get_predictions(self, sample_rate, data):
+        if sample_rate == params.SAMPLE_RATE and len(data.shape) == 1:
+            predictions = self._run_pcm(data.astype(np.int16, copy=False))
+        else:
+            # Mixing and resampling stay in NumPy, feed the float samples.
+            samples = self._to_float(data)
+            if len(samples.shape) > 1:
+                samples = np.mean(samples, axis=1)
+            samples = resample.resample(
+                samples, sample_rate, params.SAMPLE_RATE)
+            predictions = self._run_samples(samples)
+
+        self._log_first_prediction()
+        return self._filter_predictions(predictions[0])
@@ -0,0 +1,116 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+
+__all__ = ['RingBuffer']
+
+
+class RingBuffer(object):
+    """
+    Preallocated FIFO of samples
+    Writes go in place and drop the oldest samples when full, reads hand out
+    views of the stored samples or one contiguous copy, so nothing is copied
+    in proportion to the buffer length on every write.
+    """
+
+    def __init__(self, capacity, channels=1, dtype=np.int16):
+        """
+        Init buffer
+        :param capacity: Samples (frames for multichannel data) kept
+        :param channels: Channels per frame, 1 stores a 1-D signal
+        :param dtype: Sample type
+        """
+        if capacity < 1:
+            raise ValueError('"capacity" must be positive')
+
+        shape = (capacity,) if channels == 1 else (capacity, channels)
+        self._data = np.zeros(shape, dtype)
+        self.clear()
+
+    @property
+    def capacity(self):
+        return self._data.shape[0]
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        """
+        Drop all samples
+        :return:
+        """
+        self._start = 0
+        self._size = 0
+
+    def write(self, data):
+        """
+        Append samples, dropping the oldest ones that don't fit
+        :param data: np.array of samples, converted to buffer type
+        :return: Number of samples dropped
+        """
+        capacity = self.capacity
+        count = len(data)
+        dropped = max(0, self._size + count - capacity)
+        if count >= capacity:
+            self._data[:] = data[count - capacity:]
+            self._start = 0
+            self._size = capacity
+            return dropped
+
+        if dropped:
+            self._start = (self._start + dropped) % capacity
+            self._size -= dropped
+
+        end = (self._start + self._size) % capacity
+        first = min(count, capacity - end)
+        self._data[end:end + first] = data[:first]
+        self._data[:count - first] = data[first:]
+        self._size += count
+        return dropped
+
+    def views(self, count=None):
+        """
+        Get oldest samples without copying or consuming them
+        :param count: Samples to get, all by default
+        :return: Tuple of one or two views, in order
+        """
+        count = self._size if count is None else min(count, self._size)
+        first = min(count, self.capacity - self._start)
+        head = self._data[self._start:self._start + first]
+        if first == count:
+            return head,
+        return head, self._data[:count - first]
+
+    def consume(self, count):
+        """
+        Drop oldest samples
+        :param count: Samples to drop
+        :return:
+        """
+        count = min(count, self._size)
+        self._start = (self._start + count) % self.capacity
+        self._size -= count
+
+    def read(self, count=None):
+        """
+        Take oldest samples out as one contiguous copy
+        :param count: Samples to take, all by default
+        :return: np.array of samples
+        """
+        views = self.views(count)
+        data = np.concatenate(views)
+        self.consume(len(data))
+        return data
@@ -0,0 +1,273 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Inference scheduling of several audio streams sharing one processor.
+
+Captured chunks wait in a bounded queue per stream.  Each batch takes the
+oldest chunk of up to max_batch streams in weighted fair order: a stream is
+charged the audio it had processed divided by its weight, and the streams
+charged least go first.  Chunks older than the stream deadline are dropped
+or merged with the ones queued after them, so an overloaded processor falls
+behind by a bounded time instead of without limit.
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+__all__ = ['Chunk', 'InferenceScheduler', 'STALE_POLICIES']
+
+
+STALE_POLICIES = ('drop', 'merge')
+
+
+class Chunk(object):
+    """Captured audio of one stream waiting for inference."""
+
+    def __init__(self, stream, data, reset=False):
+        """
+        Init chunk
+        :param stream: Stream the audio came from
+        :param data: np.array of int16 samples
+        :param reset: Audio doesn't continue the previous chunk of the
+        stream, its state has to be reset first
+        """
+        self.stream = stream
+        self.data = data
+        self.reset = reset
+        self.submitted = time.time()
+
+
+class _StreamQueue(object):
+    def __init__(self, weight, queue_size, deadline, stale):
+        self.weight = weight
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.stale = stale
+        self.chunks = deque()
+        self.charge = 0.0
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.merged = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_last = 0.0
+        self.ended = False
+
+
+class InferenceScheduler(object):
+    def __init__(self, max_batch=8):
+        """
+        Init scheduler
+        :param max_batch: Streams processed together at most
+        """
+        if max_batch < 1:
+            raise ValueError('"max_batch" must be positive')
+
+        self._max_batch = max_batch
+        self._streams = {}
+        self._order = []
+        self._charge = 0.0  # charge of the last stream served
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def add_stream(self, stream, weight=1.0, queue_size=4, deadline=None,
+                   stale='drop'):
+        """
+        Register stream
+        :param stream: Object with a "name", chunks of it are submitted with
+        submit
+        :param weight: Share of the processor relative to other streams
+        :param queue_size: Chunks queued at most, the oldest one is dropped
+        for a new one
+        :param deadline: Seconds a chunk may wait, None waits forever
+        :param stale: "drop" chunks past the deadline, keeping the newest one,
+        or "merge" all queued chunks into one
+        :return:
+        """
+        if weight <= 0:
+            raise ValueError('"weight" must be positive')
+        if queue_size < 1:
+            raise ValueError('"queue_size" must be positive')
+        if stale not in STALE_POLICIES:
+            raise ValueError('Unknown stale policy "{}"'.format(stale))
+
+        with self._condition:
+            self._streams[stream] = _StreamQueue(weight, queue_size,
+                                                 deadline, stale)
+            self._order.append(stream)
+
+    def submit(self, stream, data, reset=False):
+        """
+        Queue captured audio, callable from any thread
+        :param stream: Registered stream
+        :param data: np.array of int16 samples following the previous chunk
+        :param reset: Audio doesn't continue the previous chunk
+        :return:
+        """
+        with self._condition:
+            queue = self._streams[stream]
+            if not queue.chunks:
+                # An idle stream doesn't save up a share for later.
+                queue.charge = max(queue.charge, self._charge)
+            queue.chunks.append(Chunk(stream, data, reset))
+            queue.submitted += 1
+            if len(queue.chunks) > queue.queue_size:
+                self._drop(queue, 1)
+            self._condition.notify()
+
+    def end_stream(self, stream):
+        """
+        Mark stream ended, nothing is submitted for it afterwards
+        :param stream: Registered stream
+        :return:
+        """
+        with self._condition:
+            self._streams[stream].ended = True
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Wake up next_batch callers, queued chunks are still handed out
+        :return:
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def pending(self):
+        """
+        Count queued chunks
+        :return: Chunks of all streams waiting for next_batch
+        """
+        with self._condition:
+            return sum(len(q.chunks) for q in self._streams.values())
+
+    def next_batch(self, timeout=None):
+        """
+        Wait for chunks and take the next batch
+        :param timeout: Seconds to wait if nothing is queued, None waits
+        until close or until all streams ended
+        :return: List of Chunk, at most one per stream, empty on timeout, when
+        closed or when all streams ended and nothing is queued
+        """
+        end = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while not self._closed and not self._has_chunks() and \
+                    not all(q.ended for q in self._streams.values()):
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            now = time.time()
+            for queue in self._streams.values():
+                self._expire(queue, now)
+
+            ready = [s for s in self._order if self._streams[s].chunks]
+            # Stable sort, ties go in registration order.
+            ready.sort(key=lambda s: self._streams[s].charge)
+            batch = []
+            for stream in ready[:self._max_batch]:
+                queue = self._streams[stream]
+                chunk = queue.chunks.popleft()
+                self._charge = queue.charge
+                queue.charge += len(chunk.data) / queue.weight
+                batch.append(chunk)
+            return batch
+
+    def done(self, batch):
+        """
+        Record latency of a processed batch
+        :param batch: List of Chunk from next_batch
+        :return:
+        """
+        now = time.time()
+        with self._condition:
+            for chunk in batch:
+                queue = self._streams[chunk.stream]
+                latency = now - chunk.submitted
+                queue.processed += 1
+                queue.latency_total += latency
+                queue.latency_max = max(queue.latency_max, latency)
+                queue.latency_last = latency
+
+    def drop(self, batch):
+        """
+        Record chunks taken with next_batch whose results were dropped
+        :param batch: List of Chunk
+        :return:
+        """
+        with self._condition:
+            for chunk in batch:
+                self._streams[chunk.stream].dropped += 1
+
+    def stats(self):
+        """
+        Get counters of all streams
+        :return: Dict of stream name to dict of "submitted", "processed",
+        "dropped" and "merged" chunk counts, chunks "queued" now and
+        "latency_last", "latency_mean" and "latency_max" seconds from
+        submit to the end of processing
+        """
+        with self._condition:
+            stats = {}
+            for stream in self._order:
+                queue = self._streams[stream]
+                stats[stream.name] = {
+                    'submitted': queue.submitted,
+                    'processed': queue.processed,
+                    'dropped': queue.dropped,
+                    'merged': queue.merged,
+                    'queued': len(queue.chunks),
+                    'latency_last': queue.latency_last,
+                    'latency_mean': queue.latency_total /
+                    max(queue.processed, 1),
+                    'latency_max': queue.latency_max,
+                }
+            return stats
+
+    def _has_chunks(self):
+        return any(q.chunks for q in self._streams.values())
+
+    def _drop(self, queue, count):
+        if not count:
+            return
+        for _ in range(count):
+            queue.chunks.popleft()
+        queue.dropped += count
+        # The audio in between is gone.
+        queue.chunks[0].reset = True
+
+    def _expire(self, queue, now):
+        if queue.deadline is None or not queue.chunks or \
+                now - queue.chunks[0].submitted <= queue.deadline:
+            return
+
+        if queue.stale == 'drop':
+            stale = sum(now - c.submitted > queue.deadline
+                        for c in queue.chunks)
+            # The newest audio is worth processing late rather than never.
+            self._drop(queue, min(stale, len(queue.chunks) - 1))
+        elif len(queue.chunks) > 1:
+            first = queue.chunks[0]
+            first.data = np.concatenate([c.data for c in queue.chunks])
+            first.reset = any(c.reset for c in queue.chunks)
+            queue.merged += len(queue.chunks) - 1
+            queue.chunks.clear()
+            queue.chunks.append(first)
@@ -0,0 +1,184 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sliding-window analysis state.
+
+A window of the latest examples is classified every hop.  Embeddings of
+examples already seen are kept in a ring cache, so each hop runs VGGish only
+on the examples that arrived since the previous one.
+"""
+
+import numpy as np
+
+from . import params
+
+
+__all__ = ['EmbeddingCache', 'SlidingStream', 'seconds_to_examples']
+
+
+def seconds_to_examples(seconds):
+    """
+    Convert duration to a whole number of examples
+    :param seconds: Duration
+    :return: Examples, at least 1
+    """
+    return max(1, int(round(seconds / params.EXAMPLE_HOP_SECONDS)))
+
+
+class EmbeddingCache(object):
+    """Ring buffer of the latest embeddings keyed by example index.
+
+    Indices count examples from the last reset, the cache holds those in
+    [start, stop).
+    """
+
+    def __init__(self, capacity, size=params.EMBEDDING_SIZE,
+                 dtype=np.float32):
+        """
+        Init cache
+        :param capacity: Embeddings kept
+        :param size: Embedding length
+        :param dtype: Embedding type
+        """
+        self._data = np.zeros((capacity, size), dtype)
+        self.reset()
+
+    @property
+    def capacity(self):
+        return self._data.shape[0]
+
+    @property
+    def start(self):
+        return max(0, self.stop - self.capacity)
+
+    def reset(self):
+        """
+        Drop cached embeddings and restart indices from 0
+        :return:
+        """
+        self.stop = 0
+
+    def __contains__(self, index):
+        return self.start <= index < self.stop
+
+    def __getitem__(self, index):
+        if index not in self:
+            raise KeyError(index)
+        return self._data[index % self.capacity]
+
+    def append(self, embeddings):
+        """
+        Add embeddings of the next examples, dropping the oldest
+        :param embeddings: (count, size) array
+        :return:
+        """
+        skipped = max(0, embeddings.shape[0] - self.capacity)
+        first = self.stop + skipped
+        rows = np.arange(first, self.stop + embeddings.shape[0]) % \
+            self.capacity
+        self._data[rows] = embeddings[skipped:]
+        self.stop += embeddings.shape[0]
+
+    def get(self, start, stop):
+        """
+        Copy embeddings in index order
+        :param start: First index, at least self.start
+        :param stop: Index after the last one, at most self.stop
+        :return: (stop - start, size) array
+        """
+        if start < self.start or stop > self.stop:
+            raise KeyError((start, stop))
+        return self._data[np.arange(start, stop) % self.capacity]
+
+
+class SlidingStream(object):
+    """Stream state of sliding-window analysis.
+
+    Pushes go through the streaming frontend like a plain stream.  Every hop
+    examples a window of up to window examples ending there is due for
+    classification.
+    """
+
+    def __init__(self, frontend, window, hop):
+        """
+        Init stream
+        :param frontend: vggish.input.StreamingFrontend
+        :param window: Examples classified together
+        :param hop: Examples between classifications
+        """
+        if window < 1 or hop < 1:
+            raise ValueError('Window and hop must be at least one example')
+
+        self.frontend = frontend
+        self.window = window
+        self.hop = hop
+        self.cache = EmbeddingCache(window)
+        # Whether each cached example passed the gate, see gate.EnergyGate.
+        self.activity = EmbeddingCache(window, 1, bool)
+
+    def reset(self):
+        """
+        Drop buffered audio and embeddings, next pushed data starts a new
+        stream
+        :return:
+        """
+        self.frontend.reset()
+        self.cache.reset()
+        self.activity.reset()
+
+    def push(self, data):
+        """
+        Feed next chunk of continuous audio
+        :param data: np.array of samples following the previous chunk
+        :return: Examples completed by this chunk
+        """
+        return self.frontend.push(data)
+
+    def add(self, embeddings, flush=False, active=None):
+        """
+        Cache embeddings of pushed examples
+        :param embeddings: (count, size) array, count of the last push
+        :param flush: Also return the window ending at the last example if
+        no hop ends there, for the end of a stream
+        :param active: (count,) bool array, False for examples kept from the
+        models by a gate, all True by default
+        :return: List of (end, embeddings, active) for every hop ending in
+        this batch, end is the index after the last example of the window,
+        active is False if no example of it passed the gate
+        """
+        if active is None:
+            active = np.ones(embeddings.shape[0], bool)
+
+        # Windows of all hops ending in this batch, built from the cached
+        # embeddings followed by the new ones.
+        base = self.cache.start
+        available = np.concatenate(
+            (self.cache.get(base, self.cache.stop), embeddings))
+        available_active = np.concatenate(
+            (self.activity.get(base, self.cache.stop)[:, 0], active))
+        stop = self.cache.stop + embeddings.shape[0]
+
+        windows = []
+        first_end = -(-(self.cache.stop + 1) // self.hop) * self.hop
+        ends = list(range(first_end, stop + 1, self.hop))
+        if flush and stop % self.hop:
+            ends.append(stop)
+        for end in ends:
+            start = max(0, end - self.window)
+            windows.append((end, available[start - base:end - base],
+                            available_active[start - base:end - base].any()))
+
+        self.cache.append(embeddings)
+        self.activity.append(active[:, None])
+        return windows
@@ -0,0 +1,373 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Audio sources for Captor besides the microphone.
+
+A source hands out int16 mono samples at the capture rate through
+read_available(timeout), like AudioDevice in callback mode: it returns the
+samples that arrived so far and how many were dropped, an empty array if
+nothing came within timeout, and None for the data once the source is
+exhausted.
+"""
+
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import logging
+import numpy as np
+from scipy.io import wavfile
+
+from .device import AudioDevice
+from .ring_buffer import RingBuffer
+from .utils import resample
+
+
+__all__ = ['AudioSource', 'WavFileSource', 'PcmStreamSource', 'TcpSource',
+           'DeviceChannels', 'ChannelSource', 'create_source',
+           'create_sources']
+
+logger = logging.getLogger('audio_analysis.sources')
+
+
+class AudioSource(object):
+    def read_available(self, timeout=None):
+        """
+        Take samples that arrived since the previous call
+        :param timeout: Seconds to wait if nothing arrived, None waits forever
+        :return: (np.array of int16 samples or None at the end, samples
+        dropped since the previous call)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+
+class WavFileSource(AudioSource):
+    """Replays a wav file in real time, faster or as fast as possible."""
+
+    _block_time = 0.1  # seconds of audio handed out per step at most
+
+    def __init__(self, path, sample_rate=16000, speed=1.0, loop=False):
+        """
+        Open file
+        :param path: 16-bit wav file, mixed to mono and resampled as needed
+        :param sample_rate: Capture rate
+        :param speed: Playback speed, 0 for as fast as it is read
+        :param loop: Start over at the end of file instead of stopping
+        """
+        file_rate, data = wavfile.read(path, mmap=True)
+        if data.dtype != np.int16:
+            raise TypeError('Bad sample type: %r' % data.dtype)
+
+        self._file_rate = file_rate
+        self._data = data
+        self._sample_rate = sample_rate
+        self._speed = speed
+        self._loop = loop
+        self._resampler = None
+        if file_rate != sample_rate:
+            self._resampler = resample.Resampler(file_rate, sample_rate)
+        self._position = 0
+        self._start_time = None
+        self._emitted = 0
+
+    def _take(self, count):
+        # Next count file samples as mono int16 at the capture rate.
+        chunk = np.array(self._data[self._position:self._position + count])
+        self._position += len(chunk)
+        if len(chunk.shape) > 1:
+            chunk = np.mean(chunk, axis=1)
+        if self._resampler is not None:
+            chunk = self._resampler.push(chunk.astype(np.float64))
+        return np.clip(np.round(chunk), -32768, 32767).astype(np.int16)
+
+    def read_available(self, timeout=None):
+        if self._position >= len(self._data):
+            if not self._loop:
+                return None, 0
+            self._position = 0
+
+        block = max(1, int(self._block_time*self._file_rate))
+        if not self._speed:
+            return self._take(block), 0
+
+        now = time.time()
+        if self._start_time is None:
+            self._start_time = now
+        # File samples due by now at the playback speed.
+        due = int((now - self._start_time)*self._file_rate*self._speed) - \
+            self._emitted
+        if due <= 0:
+            time.sleep(self._block_time if timeout is None else
+                       min(self._block_time, timeout))
+            return np.zeros(0, np.int16), 0
+
+        count = min(due, block, len(self._data) - self._position)
+        self._emitted += count
+        return self._take(count), 0
+
+
+class PcmStreamSource(AudioSource):
+    """Raw little-endian int16 mono samples from a pipe, FIFO or socket."""
+
+    _read_size = 1 << 16
+
+    def __init__(self, stream):
+        """
+        Init source
+        :param stream: Object with fileno(), or a path to open, "-" for stdin
+        """
+        if stream == '-':
+            stream = sys.stdin.buffer
+        elif isinstance(stream, str):
+            # Opening a FIFO blocks until a writer connects.
+            stream = open(stream, 'rb', buffering=0)
+        self._stream = stream
+        self._fd = stream.fileno()
+        self._partial = b''
+
+    def read_available(self, timeout=None):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return np.zeros(0, np.int16), 0
+
+        chunk = os.read(self._fd, self._read_size)
+        if not chunk:
+            return None, 0
+
+        # Keep an odd trailing byte for the next read.
+        chunk = self._partial + chunk
+        size = len(chunk) & ~1
+        self._partial = chunk[size:]
+        return np.frombuffer(chunk[:size], '<i2').astype(np.int16), 0
+
+    def close(self):
+        if self._stream is not sys.stdin.buffer:
+            self._stream.close()
+
+
+class TcpSource(AudioSource):
+    """
+    Listens for a sensor streaming raw PCM, as PcmStreamSource expects
+    One connection is read at a time, the next one is accepted when it
+    closes.
+    """
+
+    def __init__(self, host, port):
+        """
+        Start listening
+        :param host: Address to bind
+        :param port: Port to bind
+        """
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(1)
+        self._connection = None
+        self._reader = None
+        logger.info('Waiting for PCM on {}:{}.'.format(host, port))
+
+    def read_available(self, timeout=None):
+        if self._connection is None:
+            ready, _, _ = select.select([self._server], [], [], timeout)
+            if not ready:
+                return np.zeros(0, np.int16), 0
+            self._connection, address = self._server.accept()
+            self._reader = PcmStreamSource(self._connection)
+            logger.info('PCM sender {} connected.'.format(address))
+
+        data, dropped = self._reader.read_available(timeout)
+        if data is None:
+            logger.info('PCM sender disconnected.')
+            self._reader.close()
+            self._connection = self._reader = None
+            return np.zeros(0, np.int16), 0
+        return data, dropped
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+        self._server.close()
+
+
+class DeviceChannels(object):
+    """
+    One multichannel input device shared by a ChannelSource per channel
+    The device is opened once, whichever source reads first moves the
+    captured frames into per-channel buffers for all of them.
+    """
+
+    def __init__(self, channels, sample_rate=16000, period=None,
+                 buffer_time=5, device_index=None):
+        """
+        Open device
+        :param channels: Channels captured
+        :param sample_rate: Capture rate
+        :param period: PortAudio callback period (seconds)
+        :param buffer_time: Seconds kept per channel before the oldest
+        samples are dropped
+        :param device_index: PortAudio input device, None for the default one
+        """
+        self._device = AudioDevice(
+            sample_rate, max(1, int((period or 0.1)*sample_rate)),
+            buffer_time, device_index, channels)
+        self._lock = threading.Lock()
+        self._buffers = [RingBuffer(int(buffer_time*sample_rate))
+                         for _ in range(channels)]
+        self._dropped = [0]*channels
+        self._ended = False
+        self._users = 0
+
+    def source(self, channel):
+        """
+        Create source of one channel, the device is closed with the last one
+        :param channel: Channel index
+        :return: ChannelSource
+        """
+        if not 0 <= channel < len(self._buffers):
+            raise ValueError('No channel {}, device has {}'.format(
+                channel, len(self._buffers)))
+        self._users += 1
+        return ChannelSource(self, channel)
+
+    def read_available(self, channel, timeout=None):
+        with self._lock:
+            buf = self._buffers[channel]
+            if not self._ended:
+                # Don't wait for the device with samples already buffered.
+                data, dropped = self._device.read_available(
+                    0 if len(buf) else timeout)
+                if data is None:
+                    self._ended = True
+                else:
+                    for i, b in enumerate(self._buffers):
+                        self._dropped[i] += b.write(data[:, i]) + dropped
+            if self._ended and not len(buf):
+                return None, 0
+
+            data = buf.read() if len(buf) else np.zeros(0, np.int16)
+            dropped, self._dropped[channel] = self._dropped[channel], 0
+        return data, dropped
+
+    def release(self):
+        self._users -= 1
+        if not self._users:
+            self._device.close()
+
+
+class ChannelSource(AudioSource):
+    """One channel of a DeviceChannels device."""
+
+    def __init__(self, device, channel):
+        self._device = device
+        self._channel = channel
+
+    def read_available(self, timeout=None):
+        return self._device.read_available(self._channel, timeout)
+
+    def close(self):
+        if self._device is not None:
+            self._device.release()
+            self._device = None
+
+
+def create_source(spec, sample_rate=16000, speed=1.0, loop=False,
+                  period=None):
+    """
+    Create source from a command line spec
+    :param spec: "mic", "mic:DEVICE" (PortAudio device index), "wav:PATH",
+    "pcm:PATH" ("pcm:-" for stdin) or "tcp:HOST:PORT"
+    :param sample_rate: Capture rate
+    :param speed: Playback speed of wav sources, 0 for as fast as possible
+    :param loop: Replay wav sources forever
+    :param period: PortAudio callback period (seconds) of other than the
+    default microphone
+    :return: AudioSource, None for the default microphone
+    """
+    kind, _, arg = spec.partition(':')
+    if kind == 'mic':
+        if not arg:
+            return None
+        return AudioDevice(sample_rate,
+                           max(1, int((period or 0.1)*sample_rate)),
+                           device_index=int(arg))
+    if kind == 'wav':
+        return WavFileSource(arg, sample_rate, speed, loop)
+    if kind == 'pcm':
+        return PcmStreamSource(arg or '-')
+    if kind == 'tcp':
+        host, _, port = arg.rpartition(':')
+        return TcpSource(host or '0.0.0.0', int(port))
+    raise ValueError('Unknown audio source "{}"'.format(spec))
+
+
+def create_sources(specs, sample_rate=16000, speed=1.0, loop=False,
+                   period=None):
+    """
+    Create sources of several streams captured at once
+    :param specs: List of specs as for create_source, optionally named as
+    "NAME=SPEC", and "mic:DEVICE:CHANNEL" for one channel of a multichannel
+    device (DEVICE may be empty for the default one), channels of one device
+    share it
+    :param sample_rate: Capture rate
+    :param speed: Playback speed of wav sources, 0 for as fast as possible
+    :param loop: Replay wav sources forever
+    :param period: PortAudio callback period (seconds)
+    :return: List of (name, AudioSource or None for the default microphone),
+    names default to the spec
+    """
+    parsed = []
+    channels = {}
+    for spec in specs:
+        name, sep, rest = spec.partition('=')
+        if sep and ':' not in name:
+            spec = rest
+        else:
+            name = spec
+        kind, _, arg = spec.partition(':')
+        device, sep, channel = arg.partition(':')
+        if kind == 'mic' and sep:
+            device = int(device) if device else None
+            channel = int(channel)
+            channels[device] = max(channels.get(device, 0), channel + 1)
+            parsed.append((name, spec, (device, channel)))
+        else:
+            parsed.append((name, spec, None))
+
+    names = [name for name, _, _ in parsed]
+    if len(set(names)) != len(names):
+        raise ValueError('Stream names must be unique: {}'.format(names))
+
+    devices = dict(
+        (device, DeviceChannels(count, sample_rate, period,
+                                device_index=device))
+        for device, count in channels.items())
+    sources = []
+    for name, spec, channel in parsed:
+        if channel is None:
+            sources.append((name, create_source(spec, sample_rate, speed,
+                                                loop, period)))
+        else:
+            sources.append((name, devices[channel[0]].source(channel[1])))
+    return sources
@@ -0,0 +1,97 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Several audio streams analyzed by one processor.
+
+Each stream has its own Captor, capture buffer and processor stream state,
+so results of one never depend on audio of another, while the models are
+loaded only once.
+"""
+
+import threading
+
+from .captor import Captor
+
+
+__all__ = ['CaptureStream']
+
+
+class CaptureStream(object):
+    """Captor of one audio source with the state of its analysis."""
+
+    def __init__(self, name, min_time, max_time, shutdown_event=None,
+                 period=None, source=None, gate=None):
+        """
+        Init stream
+        :param name: Stream name reported with its predictions
+        :param min_time: Minimum capture time to process (seconds)
+        :param max_time: Maximum capture time to process (seconds)
+        :param shutdown_event: Event to shutdown capture
+        :param period: PortAudio callback period (seconds), see Captor
+        :param source: sources.AudioSource, None for the default microphone
+        :param gate: gate.EnergyGate of this stream, None classifies all
+        audio
+        """
+        self.name = name
+        self.state = None
+        self.gate = gate
+        self._scheduler = None
+        self._overflowed = False
+        # Captured data goes to the scheduler queue as soon as it is ready.
+        ask_data_event = threading.Event()
+        ask_data_event.set()
+        self._captor = Captor(min_time, max_time, ask_data_event,
+                              self._on_data, shutdown_event,
+                              overflow_callback=self._on_overflow,
+                              period=period, source=source,
+                              end_callback=self._on_end)
+
+    def start(self, state, scheduler):
+        """
+        Start capture
+        :param state: Processor stream state, see WavProcessor.create_stream
+        and create_sliding_stream
+        :param scheduler: scheduler.InferenceScheduler the stream was added
+        to, captured chunks are submitted to it and the end of capture is
+        reported with end_stream
+        :return:
+        """
+        self.state = state
+        self._scheduler = scheduler
+        self._captor.start()
+
+    def is_alive(self):
+        return self._captor.is_alive()
+
+    def reset(self):
+        """
+        Reset stream state, call from the processing thread only
+        :return:
+        """
+        if self.state is not None:
+            self.state.reset()
+        if self.gate is not None:
+            self.gate.reset()
+
+    def _on_overflow(self):
+        # The state is in use by the processing thread, the reset goes along
+        # with the next chunk.
+        self._overflowed = True
+
+    def _on_data(self, data):
+        reset, self._overflowed = self._overflowed, False
+        self._scheduler.submit(self, data, reset)
+
+    def _on_end(self):
+        self._scheduler.end_stream(self)
@@ -0,0 +1,163 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Rational polyphase resampling with cached filters.
+
+The rate change src -> dst is done as upsampling by `up`, low-pass filtering
+and downsampling by `down`, where up/down is dst/src in lowest terms.  Only
+the outputs that survive downsampling are computed, each one from the single
+filter phase that lines up with real input samples.  The filter is a Kaiser
+windowed sinc, built once per (src, dst) pair and kept for the life of the
+process.
+"""
+
+from math import gcd
+
+import numpy as np
+from scipy import signal
+
+
+__all__ = ['Resampler', 'resample']
+
+
+# Filter shape close to resampy's "kaiser_fast": about 80 dB of stopband
+# attenuation, passband up to 95% of the lower Nyquist frequency.
+_HALF_ZERO_CROSSINGS = 16
+_KAISER_BETA = 8.6
+_ROLLOFF = 0.95
+_MAX_PUSH = 1 << 16  # Bounds the per-call work arrays on long signals.
+
+_filters = {}
+
+
+def _get_filter(src_rate, dst_rate):
+    key = (src_rate, dst_rate)
+    if key not in _filters:
+        common = gcd(src_rate, dst_rate)
+        up = dst_rate // common
+        down = src_rate // common
+        max_rate = max(up, down)
+        if max_rate == 1:
+            half_len = 0
+            taps = np.ones(1)
+        else:
+            half_len = _HALF_ZERO_CROSSINGS * max_rate
+            taps = signal.firwin(2*half_len + 1, _ROLLOFF / max_rate,
+                                 window=('kaiser', _KAISER_BETA)) * up
+
+        # Row p holds the taps used by outputs that fall on phase p of the
+        # upsampled grid, reversed to run forward over the input.
+        taps_per_phase = -(-len(taps) // up)
+        padded = np.zeros(taps_per_phase*up)
+        padded[:len(taps)] = taps
+        phases = padded.reshape(taps_per_phase, up).T[:, ::-1]
+
+        _filters[key] = (up, down, half_len, np.ascontiguousarray(phases))
+
+    return _filters[key]
+
+
+class Resampler(object):
+    """Streaming resampler.
+
+    Keeps the input tail still needed by the filter and the position of the
+    next output between calls, so a signal pushed in chunks of any size gives
+    the same samples (up to rounding) as resample() on the whole signal.
+    Output lags input by half the filter length, that tail comes out with
+    following data.
+    """
+
+    def __init__(self, src_rate, dst_rate, dtype=np.float64):
+        """
+        Init resampler
+        :param src_rate: Sample rate of pushed data
+        :param dst_rate: Sample rate of returned data
+        :param dtype: Precision of filtering
+        """
+        if src_rate <= 0 or dst_rate <= 0:
+            raise ValueError('Sample rates must be positive')
+
+        self._up, self._down, self._delay, phases = _get_filter(
+            int(src_rate), int(dst_rate))
+        self._phases = phases.astype(dtype, copy=False)
+        self._taps_per_phase = phases.shape[1]
+        self._dtype = np.dtype(dtype)
+        self.reset()
+
+    def reset(self):
+        """
+        Drop buffered state, next pushed data starts a new stream
+        :return:
+        """
+        # Input history starts with zeros before the first sample.
+        self._buf = np.zeros(self._taps_per_phase - 1, self._dtype)
+        self._buf_start = 1 - self._taps_per_phase
+        self._next_output = 0
+
+    def push(self, data):
+        """
+        Resample next chunk of a 1-D signal
+        :param data: np.array of samples following the previous chunk
+        :return: np.array of output samples that can be computed so far
+        """
+        if len(data) > _MAX_PUSH:
+            return np.concatenate([self.push(data[i:i + _MAX_PUSH])
+                                   for i in range(0, len(data), _MAX_PUSH)])
+
+        up, down = self._up, self._down
+        buf = np.concatenate((self._buf, data.astype(self._dtype, copy=False)))
+        buf_end = self._buf_start + len(buf)
+
+        # Output n is at t = delay + n*down on the upsampled grid and needs
+        # input samples up to t // up.
+        first = self._next_output
+        last = (buf_end*up - 1 - self._delay) // down
+        count = max(0, last - first + 1)
+        out = np.empty(count, self._dtype)
+
+        step = buf.strides[0]
+        for r in range(min(up, count)):
+            t = self._delay + (first + r)*down
+            phase = t % up
+            window_start = t // up - self._buf_start - \
+                (self._taps_per_phase - 1)
+            windows = np.lib.stride_tricks.as_strided(
+                buf[window_start:],
+                shape=(len(range(r, count, up)), self._taps_per_phase),
+                strides=(down*step, step))
+            out[r::up] = np.dot(windows, self._phases[phase])
+
+        self._next_output = first + count
+        keep_from = (self._delay + self._next_output*down) // up - \
+            (self._taps_per_phase - 1)
+        self._buf = buf[keep_from - self._buf_start:].copy()
+        self._buf_start = keep_from
+        return out
+
+
+def resample(data, src_rate, dst_rate):
+    """
+    Resample a whole 1-D signal
+    :param data: np.array of samples
+    :param src_rate: Sample rate of data
+    :param dst_rate: Sample rate of result
+    :return: np.array of ceil(len(data)*dst_rate/src_rate) samples
+    """
+    resampler = Resampler(src_rate, dst_rate,
+                          np.result_type(data.dtype, np.float32))
+    up, down = resampler._up, resampler._down
+    size = -(-len(data)*up // down)
+    # Flush the filter tail with zeros after the end of data.
+    tail = np.zeros(resampler._taps_per_phase + resampler._delay // up + 1)
+    return np.concatenate((resampler.push(data), resampler.push(tail)))[:size]
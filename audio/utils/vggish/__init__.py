@@ -12,4 +12,4 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from . import input, mel_features, model
+from . import frontend, input, mel_features, model, numpy_model
@@ -17,13 +17,14 @@
 # limitations under the License.
 
 import numpy as np
-import resampy
 
 from audio import params
+from audio.utils import resample
 from . import mel_features
+from .frontend import FrontendPlan
 
 
-def waveform_to_examples(data, sample_rate):
+def waveform_to_examples(data, sample_rate, plan=None):
     """Converts audio waveform into an array of examples for VGGish.
 
     Args:
@@ -32,6 +33,9 @@ def waveform_to_examples(data, sample_rate):
         Each sample is generally expected to lie in the range [-1.0, +1.0],
         although this is not required.
       sample_rate: Sample rate of data.
+      plan: FrontendPlan to reuse. A temporary one is built if not provided.
+        With a plan the result is a view of its buffer, valid until the plan
+        is used again.
 
     Returns:
       3-D np.array of shape [num_examples, num_frames, num_bands] which represents
@@ -44,27 +48,112 @@ def waveform_to_examples(data, sample_rate):
         data = np.mean(data, axis=1)
     # Resample to the rate assumed by VGGish.
     if sample_rate != params.SAMPLE_RATE:
-        data = resampy.resample(data, sample_rate, params.SAMPLE_RATE)
+        data = resample.resample(data, sample_rate, params.SAMPLE_RATE)
 
     # Compute log mel spectrogram features.
-    log_mel = mel_features.log_mel_spectrogram(
-        data,
-        audio_sample_rate=params.SAMPLE_RATE,
-        log_offset=params.LOG_OFFSET,
-        window_length_secs=params.STFT_WINDOW_LENGTH_SECONDS,
-        hop_length_secs=params.STFT_HOP_LENGTH_SECONDS,
-        num_mel_bins=params.NUM_MEL_BINS,
-        lower_edge_hertz=params.MEL_MIN_HZ,
-        upper_edge_hertz=params.MEL_MAX_HZ)
+    if plan is None:
+        plan = FrontendPlan()
+    log_mel = plan.log_mel_spectrogram(data)
 
     # Frame features into examples.
-    features_sample_rate = 1.0 / params.STFT_HOP_LENGTH_SECONDS
-    example_window_length = int(round(
-        params.EXAMPLE_WINDOW_SECONDS * features_sample_rate))
-    example_hop_length = int(round(
-        params.EXAMPLE_HOP_SECONDS * features_sample_rate))
+    example_window_length, example_hop_length = example_lengths()
     log_mel_examples = mel_features.frame(
         log_mel,
         window_length=example_window_length,
         hop_length=example_hop_length)
     return log_mel_examples
+
+
+def example_lengths():
+    """Return window and hop of examples in log mel frames."""
+    features_sample_rate = 1.0 / params.STFT_HOP_LENGTH_SECONDS
+    example_window_length = int(round(
+        params.EXAMPLE_WINDOW_SECONDS * features_sample_rate))
+    example_hop_length = int(round(
+        params.EXAMPLE_HOP_SECONDS * features_sample_rate))
+    return example_window_length, example_hop_length
+
+
+def _num_frames(length, window_length, hop_length):
+    if length < window_length:
+        return 0
+    return 1 + (length - window_length) // hop_length
+
+
+class StreamingFrontend(object):
+    """Incremental version of waveform_to_examples for continuous audio.
+
+    Keeps the samples of the STFT frame that is not complete yet and the
+    log mel frames of the example that is not complete yet between calls, so
+    every STFT frame is computed exactly once and nothing is thrown away at
+    buffer boundaries.  Feeding a waveform in any number of pieces yields the
+    same examples, bit for bit, as waveform_to_examples on the whole waveform.
+
+    Data at other sample rates goes through a streaming resample.Resampler
+    first, then examples match the batch path up to resampling round-off.
+    """
+
+    def __init__(self, sample_rate=params.SAMPLE_RATE, plan=None):
+        """
+        Init frontend
+        :param sample_rate: Sample rate of pushed data
+        :param plan: FrontendPlan to use, a new one is built if not provided
+        """
+        if plan is None:
+            plan = FrontendPlan()
+
+        self._plan = plan
+        self._resampler = None
+        if sample_rate != params.SAMPLE_RATE:
+            self._resampler = resample.Resampler(
+                sample_rate, params.SAMPLE_RATE, plan.dtype)
+        self._example_window_length, self._example_hop_length = \
+            example_lengths()
+
+        self.reset()
+
+    def reset(self):
+        """
+        Drop buffered state, next pushed data starts a new stream
+        :return:
+        """
+        self._samples = np.zeros(0, self._plan.dtype)
+        self._log_mel = np.zeros((0, params.NUM_MEL_BINS), self._plan.dtype)
+        self._skip_frames = 0
+        if self._resampler is not None:
+            self._resampler.reset()
+
+    def push(self, data):
+        """
+        Append waveform data to the stream
+        :param data: np.array of samples, see waveform_to_examples
+        :return: 3-D np.array of examples completed by this data
+        """
+        if len(data.shape) > 1:
+            data = np.mean(data, axis=1)
+        if self._resampler is not None:
+            data = self._resampler.push(data)
+
+        samples = np.concatenate((self._samples, data))
+        num_frames = self._plan.num_frames(len(samples))
+        if num_frames:
+            log_mel = self._plan.log_mel_spectrogram(samples)
+            samples = samples[num_frames*self._plan.hop_length:]
+
+            skip = min(self._skip_frames, num_frames)
+            self._skip_frames -= skip
+            self._log_mel = np.concatenate((self._log_mel, log_mel[skip:]))
+        self._samples = samples.copy()
+
+        num_examples = _num_frames(len(self._log_mel),
+                                   self._example_window_length,
+                                   self._example_hop_length)
+        examples = np.array(mel_features.frame(
+            self._log_mel,
+            window_length=self._example_window_length,
+            hop_length=self._example_hop_length)[:num_examples])
+
+        consumed = num_examples*self._example_hop_length
+        self._skip_frames += max(0, consumed - len(self._log_mel))
+        self._log_mel = self._log_mel[consumed:].copy()
+        return examples
@@ -0,0 +1,287 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""VGGish inference in NumPy.
+
+Runs the layer stack of model.define_vggish_slim with weights exported from
+the checkpoint to an .npz file: 3x3 SAME convolutions as im2col + GEMM,
+2x2 max-pools as reshape + max, fully connected layers as GEMM, ReLU after
+every layer.  Only export_weights needs TensorFlow.
+
+quantize_weights stores the fully connected layers, which hold most of the
+parameters, as int8 with per-channel scales and runs them with int32
+accumulation.  NumPy has no int8 GEMM, so the int8 layers still multiply in
+float32: they cut weight memory by 4x, not inference time.
+"""
+
+import numpy as np
+
+from audio import params
+from audio.utils import weight_store
+
+
+__all__ = ['NumpyVGGish', 'export_weights', 'quantize_weights',
+           'EMBEDDING_TOLERANCE']
+
+
+# Max absolute difference of embeddings from the TensorFlow model, checked
+# by export_weights.  Both run in float32, only summation order differs.
+EMBEDDING_TOLERANCE = 1e-3
+
+# int8 range, symmetric so zero stays exact.
+_INT8_MAX = 127
+# Longest dot product of int8 values whose sum is exact in float32.
+_EXACT_DEPTH = (1 << 24) // (_INT8_MAX * _INT8_MAX)
+# Columns of weights widened to float32 at a time, keeps tiles in cache.
+_TILE_WIDTH = 256
+
+# Layers of define_vggish_slim in order, with their checkpoint scopes.
+LAYERS = (
+    ('conv', 'vggish/conv1'),
+    ('pool', None),
+    ('conv', 'vggish/conv2'),
+    ('pool', None),
+    ('conv', 'vggish/conv3/conv3_1'),
+    ('conv', 'vggish/conv3/conv3_2'),
+    ('pool', None),
+    ('conv', 'vggish/conv4/conv4_1'),
+    ('conv', 'vggish/conv4/conv4_2'),
+    ('pool', None),
+    ('flatten', None),
+    ('fc', 'vggish/fc1/fc1_1'),
+    ('fc', 'vggish/fc1/fc1_2'),
+    ('fc', 'vggish/fc2'),
+)
+
+
+def _conv3x3(net, weights, biases):
+    # SAME padding, stride 1: every output pixel sees a 3x3 patch of the
+    # zero padded input.  Patch rows are ordered (kh, kw, in_channel) like
+    # the flattened HWIO kernel.
+    batch, height, width, channels = net.shape
+    padded = np.pad(net, ((0, 0), (1, 1), (1, 1), (0, 0)), 'constant')
+    strides = padded.strides
+    patches = np.lib.stride_tricks.as_strided(
+        padded,
+        shape=(batch, height, width, 3, 3, channels),
+        strides=strides[:3] + strides[1:3] + strides[3:])
+    patches = patches.reshape(batch*height*width, 9*channels)
+    out = np.dot(patches, weights.reshape(9*channels, -1))
+    out += biases
+    return out.reshape(batch, height, width, -1)
+
+
+def _max_pool2x2(net):
+    # SAME padding, stride 2: odd sizes get an extra row/column that never
+    # wins the max.
+    batch, height, width, channels = net.shape
+    if height % 2 or width % 2:
+        net = np.pad(net, ((0, 0), (0, height % 2), (0, width % 2), (0, 0)),
+                     'constant', constant_values=-np.inf)
+        batch, height, width, channels = net.shape
+    net = net.reshape(batch, height // 2, 2, width // 2, 2, channels)
+    return net.max(axis=(2, 4))
+
+
+def _fully_connected(net, weights, biases):
+    out = np.dot(net, weights)
+    out += biases
+    return out
+
+
+def _quantized_fully_connected(net, weights, scales, input_scale, biases):
+    # Inputs are quantized with the calibrated scale and saturated, weights
+    # are int8 with one scale per output.  Products are summed in float32
+    # over blocks short enough for the sums to be exact integers, then
+    # accumulated in int32.  Weights are widened tile by tile into a small
+    # buffer, so only the int8 copy is ever held in memory.
+    quantized = np.rint(net / input_scale)
+    np.clip(quantized, -_INT8_MAX, _INT8_MAX, out=quantized)
+    quantized = quantized.astype(np.float32)
+
+    depth, width = weights.shape
+    acc = np.zeros((net.shape[0], width), np.int32)
+    tile = np.empty((_EXACT_DEPTH, _TILE_WIDTH), np.float32)
+    for i in range(0, depth, _EXACT_DEPTH):
+        rows = min(_EXACT_DEPTH, depth - i)
+        for j in range(0, width, _TILE_WIDTH):
+            cols = min(_TILE_WIDTH, width - j)
+            block = tile[:rows, :cols]
+            block[...] = weights[i:i + rows, j:j + cols]
+            acc[:, j:j + cols] += np.dot(
+                quantized[:, i:i + rows], block).astype(np.int32)
+
+    # Scaled in float32, int32 times float32 would promote to float64.
+    out = acc.astype(np.float32)
+    out *= scales * input_scale
+    out += biases
+    return out
+
+
+def _flatten(net):
+    return net.reshape(net.shape[0], -1)
+
+
+def _relu(net):
+    np.maximum(net, 0, out=net)
+    return net
+
+
+class NumpyVGGish(object):
+    """VGGish embeddings without TensorFlow.
+
+    Callable on a batch of log mel examples like the session callable of
+    the TensorFlow model.  Weights written by quantize_weights run the fully
+    connected layers in int8.
+    """
+
+    def __init__(self, weights_path=params.VGGISH_NUMPY_WEIGHTS):
+        """
+        Load weights
+        :param weights_path: File written by export_weights or
+        quantize_weights, arrays of a weight store are used in place
+        """
+        weights = weight_store.load_arrays(weights_path)
+        self.quantized = False
+        # (scope, function, weight arguments) in order of execution.
+        self._layers = []
+        for kind, scope in LAYERS:
+            if kind == 'pool':
+                self._layers.append((None, _max_pool2x2, ()))
+                continue
+            if kind == 'flatten':
+                self._layers.append((None, _flatten, ()))
+                continue
+
+            def array(name, dtype=np.float32):
+                # No copy for store arrays already in the right type.
+                return weights[scope + name].astype(dtype, copy=False)
+
+            biases = array('/biases')
+            if kind == 'conv':
+                layer = (_conv3x3, (array('/weights'), biases))
+            elif scope + '/weights_q' in weights:
+                self.quantized = True
+                layer = (_quantized_fully_connected, (
+                    array('/weights_q', np.int8), array('/weight_scales'),
+                    array('/input_scale'), biases))
+            else:
+                layer = (_fully_connected, (array('/weights'), biases))
+            self._layers.append((scope,) + layer)
+            self._layers.append((None, _relu, ()))
+
+    def __call__(self, examples_batch, observer=None):
+        """
+        Compute embeddings
+        :param examples_batch: (batch, NUM_FRAMES, NUM_BANDS) log mel examples
+        :param observer: Called as observer(scope, data) with the input
+        of every conv and fc layer
+        :return: (batch, EMBEDDING_SIZE) float32 embeddings
+        """
+        net = np.asarray(examples_batch, np.float32)
+        net = net.reshape(-1, params.NUM_FRAMES, params.NUM_BANDS, 1)
+        for scope, function, args in self._layers:
+            if observer is not None and scope is not None:
+                observer(scope, net)
+            net = function(net, *args)
+        return net
+
+
+def export_weights(checkpoint_path, weights_path, check=True):
+    """
+    Write VGGish checkpoint variables to an .npz file
+    :param checkpoint_path: VGGish checkpoint
+    :param weights_path: Output .npz file, or weight store if it ends with
+    weight_store.STORE_EXTENSION
+    :param check: Compare NumpyVGGish with the TensorFlow model on random
+    examples and raise ValueError if they differ by more than
+    EMBEDDING_TOLERANCE
+    :return: Max absolute embedding difference, None without check
+    """
+    import tensorflow as tf
+    from . import model
+
+    reader = tf.train.NewCheckpointReader(checkpoint_path)
+    arrays = {}
+    for kind, scope in LAYERS:
+        if scope is not None:
+            for name in ('weights', 'biases'):
+                key = '{}/{}'.format(scope, name)
+                arrays[key] = reader.get_tensor(key)
+    weight_store.save_arrays(weights_path, arrays)
+
+    if not check:
+        return None
+
+    rng = np.random.RandomState(0)
+    examples = rng.uniform(
+        np.log(params.LOG_OFFSET), 3,
+        (8, params.NUM_FRAMES, params.NUM_BANDS)).astype(np.float32)
+
+    with tf.Graph().as_default(), tf.Session() as sess:
+        model.define_vggish_slim(training=False)
+        model.load_vggish_slim_checkpoint(sess, checkpoint_path)
+        expected = sess.run(params.VGGISH_OUTPUT_TENSOR_NAME, feed_dict={
+            params.VGGISH_INPUT_TENSOR_NAME: examples})
+
+    diff = np.abs(NumpyVGGish(weights_path)(examples) - expected).max()
+    if diff > EMBEDDING_TOLERANCE:
+        raise ValueError('NumPy embeddings differ by {}, more than {}'.format(
+            diff, EMBEDDING_TOLERANCE))
+    return diff
+
+
+def quantize_weights(weights_path, quantized_path, examples):
+    """
+    Write int8 version of the fully connected layers
+    :param weights_path: .npz file written by export_weights
+    :param quantized_path: Output .npz file or weight store
+    :param examples: Iterable of (batch, NUM_FRAMES, NUM_BANDS) log mel
+    example batches used to calibrate the input scale of each layer
+    :return:
+    """
+    model = NumpyVGGish(weights_path)
+    if model.quantized:
+        raise ValueError('"{}" is already quantized'.format(weights_path))
+
+    ranges = {}
+
+    def observe(scope, data):
+        ranges[scope] = max(ranges.get(scope, 0.0), float(np.abs(data).max()))
+
+    for examples_batch in examples:
+        model(examples_batch, observe)
+    if not ranges:
+        raise ValueError('No calibration examples')
+
+    weights = weight_store.load_arrays(weights_path)
+    arrays = {}
+    for kind, scope in LAYERS:
+        if scope is None:
+            continue
+        arrays[scope + '/biases'] = weights[scope + '/biases']
+        if kind == 'conv':
+            arrays[scope + '/weights'] = weights[scope + '/weights']
+            continue
+
+        # Per output channel scales for weights, one scale for inputs.
+        layer_weights = weights[scope + '/weights'].astype(np.float32)
+        scales = np.abs(layer_weights).max(axis=0) / _INT8_MAX
+        scales[scales == 0] = 1
+        arrays[scope + '/weights_q'] = np.rint(
+            layer_weights / scales).astype(np.int8)
+        arrays[scope + '/weight_scales'] = scales.astype(np.float32)
+        arrays[scope + '/input_scale'] = np.float32(
+            max(ranges[scope], 1e-6) / _INT8_MAX)
+    weight_store.save_arrays(quantized_path, arrays)
@@ -0,0 +1,155 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memory-mapped weight store.
+
+A single uncompressed file of named arrays: magic, little-endian uint64
+header size, JSON header, then the raw C-ordered array data, each array
+starting on an ALIGNMENT byte boundary.  Arrays are read as views of one
+mmap, so every process using the same file on a host maps the same page
+cache pages instead of holding a private copy.
+"""
+
+import json
+import mmap
+import struct
+
+import numpy as np
+
+
+__all__ = ['WeightStore', 'write_store', 'is_store', 'load_arrays',
+           'save_arrays', 'STORE_EXTENSION']
+
+
+STORE_EXTENSION = '.store'
+# Fits SIMD loads and TensorFlow's aligned tensor buffers.
+ALIGNMENT = 64
+
+_MAGIC = b'AAWSTORE'
+_SIZE = struct.Struct('<Q')
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_store(path, arrays, metadata=None):
+    """
+    Write arrays to a store file
+    :param path: Output file
+    :param arrays: Dict of name to np.array, numeric dtypes only
+    :param metadata: JSON serializable object kept in the header
+    :return:
+    """
+    entries = []
+    offset = 0
+    for name in sorted(arrays):
+        array = np.asarray(arrays[name])
+        if array.dtype.hasobject or array.dtype.kind in 'SUV':
+            raise TypeError('Array "{}" has unsupported dtype {}'.format(
+                name, array.dtype))
+        entries.append({'name': name, 'dtype': array.dtype.str,
+                        'shape': list(array.shape), 'offset': offset})
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({'arrays': entries,
+                         'metadata': metadata}).encode('utf-8')
+    data_start = _align(len(_MAGIC) + _SIZE.size + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(_SIZE.pack(len(header)))
+        f.write(header)
+        for entry in entries:
+            f.seek(data_start + entry['offset'])
+            f.write(np.asarray(arrays[entry['name']]).tobytes(order='C'))
+        f.truncate(data_start + offset)
+
+
+def is_store(path):
+    """
+    Check file type
+    :param path: File path
+    :return: True if path is a store written by write_store
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+
+class WeightStore(object):
+    """Mapping of names to arrays backed by a store file."""
+
+    def __init__(self, path, writeable=False):
+        """
+        Map store file
+        :param path: File written by write_store
+        :param writeable: Map copy-on-write, arrays are writeable and pages
+        stay shared until written to.  TensorFlow copies read-only arrays on
+        every feed but wraps writeable ones.
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError('"{}" is not a weight store'.format(path))
+            header_size, = _SIZE.unpack(f.read(_SIZE.size))
+            header = json.loads(f.read(header_size).decode('utf-8'))
+            # The mapping stays valid after the file is closed.
+            self._mmap = mmap.mmap(
+                f.fileno(), 0,
+                access=mmap.ACCESS_COPY if writeable else mmap.ACCESS_READ)
+
+        self.path = path
+        self.metadata = header['metadata']
+        self._data_start = _align(len(_MAGIC) + _SIZE.size + header_size)
+        self._entries = dict((e['name'], e) for e in header['arrays'])
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __getitem__(self, name):
+        entry = self._entries[name]
+        shape = tuple(entry['shape'])
+        count = 1
+        for size in shape:
+            count *= size
+        # Views of the mapping, nothing is copied.
+        return np.frombuffer(
+            self._mmap, np.dtype(entry['dtype']), count,
+            self._data_start + entry['offset']).reshape(shape)
+
+    def keys(self):
+        return sorted(self._entries)
+
+
+def load_arrays(path):
+    """
+    Open arrays written by save_arrays
+    :param path: Store or .npz file
+    :return: WeightStore or np.load result, both index arrays by name
+    """
+    if is_store(path):
+        return WeightStore(path)
+    return np.load(path)
+
+
+def save_arrays(path, arrays):
+    """
+    Write arrays as a store if path ends with STORE_EXTENSION, else as .npz
+    :param path: Output file
+    :param arrays: Dict of name to np.array
+    :return:
+    """
+    if path.endswith(STORE_EXTENSION):
+        write_store(path, arrays)
+    else:
+        np.savez(path, **arrays)
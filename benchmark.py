@@ -0,0 +1,238 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import multiprocessing
+import os
+import time
+import timeit
+import numpy as np
+
+from audio import params
+
+
+parser = argparse.ArgumentParser(description='Benchmark processing stages')
+subparsers = parser.add_subparsers(dest='command')
+subparsers.required = True
+
+frontend_parser = subparsers.add_parser(
+    'frontend', help='Log mel frontend cost per second of audio')
+frontend_parser.add_argument('--seconds', type=float, default=5,
+                             help='Clip length')
+frontend_parser.add_argument('--repeat', type=int, default=200,
+                             help='Clips to process per measurement')
+
+resample_parser = subparsers.add_parser(
+    'resample', help='Resampling cost per second of audio')
+resample_parser.add_argument('--seconds', type=float, default=600,
+                             help='Clip length')
+resample_parser.add_argument('--rates', type=int, nargs='+',
+                             default=[44100, 48000, 8000],
+                             help='Source sample rates')
+
+classifier_parser = subparsers.add_parser(
+    'classifier', help='Classifier latency against clip length')
+classifier_parser.add_argument('--frames', type=int, nargs='+',
+                               default=[1, 5, 10, 30, 100, 300],
+                               help='Clip lengths in embedding frames')
+classifier_parser.add_argument('--repeat', type=int, default=50,
+                               help='Runs per measurement')
+
+calls_parser = subparsers.add_parser(
+    'calls', help='Per-call overhead of feed dicts and compiled callables')
+calls_parser.add_argument('--examples', type=int, default=1,
+                          help='VGGish examples per call')
+calls_parser.add_argument('--repeat', type=int, default=200,
+                          help='Runs per measurement')
+calls_parser.add_argument('--bundle', default=params.MODEL_BUNDLE,
+                          help='Model bundle or weight store, checkpoints '
+                               'are used if it doesn\'t exist')
+
+threads_parser = subparsers.add_parser(
+    'threads', help='Throughput against number of cores')
+threads_parser.add_argument('--cores', type=int, nargs='+',
+                            help='Core counts to measure, default 1..all')
+threads_parser.add_argument('--clip', type=float, default=5,
+                            help='Clip length in seconds')
+threads_parser.add_argument('--duration', type=float, default=20,
+                            help='Seconds to measure each point')
+
+
+def _random_clip(seconds, sample_rate=params.SAMPLE_RATE):
+    rng = np.random.RandomState(0)
+    size = int(seconds*sample_rate)
+    return rng.randint(-32768, 32768, size).astype(np.int16)
+
+
+def _report(name, total, repeat, seconds):
+    per_second = total / repeat / seconds
+    print('{:<24} {:10.1f} us per second of audio'.format(
+        name, per_second*1e6))
+
+
+def bench_frontend(seconds, repeat):
+    from audio.utils.vggish import frontend, mel_features
+
+    samples = _random_clip(seconds) / 32768.0
+
+    def legacy():
+        mel_features.log_mel_spectrogram(
+            samples,
+            audio_sample_rate=params.SAMPLE_RATE,
+            log_offset=params.LOG_OFFSET,
+            window_length_secs=params.STFT_WINDOW_LENGTH_SECONDS,
+            hop_length_secs=params.STFT_HOP_LENGTH_SECONDS,
+            num_mel_bins=params.NUM_MEL_BINS,
+            lower_edge_hertz=params.MEL_MIN_HZ,
+            upper_edge_hertz=params.MEL_MAX_HZ)
+
+    plan = frontend.FrontendPlan()
+    plan32 = frontend.FrontendPlan(np.float32)
+    samples32 = samples.astype(np.float32)
+
+    def planned():
+        plan.log_mel_spectrogram(samples)
+
+    def planned32():
+        plan32.log_mel_spectrogram(samples32)
+
+    for name, func in (('log_mel_spectrogram', legacy),
+                       ('FrontendPlan', planned),
+                       ('FrontendPlan float32', planned32)):
+        func()  # warm up
+        _report(name, min(timeit.repeat(func, number=repeat, repeat=3)),
+                repeat, seconds)
+
+
+def bench_resample(seconds, rates):
+    from audio.utils import resample
+
+    try:
+        import resampy
+    except ImportError:
+        resampy = None
+        print('resampy is not installed, skipping it')
+
+    for rate in rates:
+        samples = _random_clip(seconds, rate) / 32768.0
+        funcs = [('resample', resample.resample)]
+        if resampy is not None:
+            funcs.append(('resampy', resampy.resample))
+
+        for name, func in funcs:
+            func(samples[:rate], rate, params.SAMPLE_RATE)  # warm up
+            total = min(timeit.repeat(
+                lambda: func(samples, rate, params.SAMPLE_RATE),
+                number=1, repeat=3))
+            _report('{} {}'.format(name, rate), total, 1, seconds)
+
+
+def bench_classifier(frames, repeat):
+    from audio.processor import WavProcessor
+    from audio.utils import youtube8m
+
+    rng = np.random.RandomState(0)
+    with WavProcessor() as proc:
+        sess = proc._youtube_sess
+        input_tensor, num_frames_tensor, predictions_tensor = \
+            proc._youtube_tensors
+
+        for count in frames:
+            features = rng.randn(count, params.EMBEDDING_SIZE)
+
+            def padded_300():
+                # Input as built before the reused pad buffer.
+                data = youtube8m.input.resize(features, 0, params.MAX_FRAMES)
+                sess.run(predictions_tensor, feed_dict={
+                    input_tensor: np.expand_dims(data, 0),
+                    num_frames_tensor: [min(count, params.MAX_FRAMES)]})
+
+            def reused():
+                proc._process_features([features])
+
+            for name, func in (('padded', padded_300), ('reused', reused)):
+                func()  # warm up
+                total = min(timeit.repeat(func, number=repeat, repeat=3))
+                print('{:<8} {:4d} frames {:8.2f} ms per clip'.format(
+                    name, count, total / repeat * 1e3))
+
+
+def bench_calls(examples, repeat, bundle):
+    from audio.processor import WavProcessor
+
+    rng = np.random.RandomState(0)
+    batch = rng.randn(examples, params.NUM_FRAMES,
+                      params.NUM_BANDS).astype(np.float32)
+
+    with WavProcessor(bundle=bundle) as proc:
+        sess = proc._vggish_sess
+        # Weights bundles keep outside the graph.
+        weights = dict(proc._vggish_weights)
+
+        def feed_dict():
+            # Lookups and feed dict as done before compiled callables.
+            graph = sess.graph
+            features_tensor = graph.get_tensor_by_name(
+                params.VGGISH_INPUT_TENSOR_NAME)
+            embedding_tensor = graph.get_tensor_by_name(
+                params.VGGISH_OUTPUT_TENSOR_NAME)
+            feed_dict = {features_tensor: batch}
+            feed_dict.update(weights)
+            sess.run([embedding_tensor], feed_dict=feed_dict)
+
+        def compiled():
+            proc._run_vggish(batch)
+
+        for name, func in (('feed_dict', feed_dict), ('callable', compiled)):
+            func()  # warm up
+            total = min(timeit.repeat(func, number=repeat, repeat=3))
+            print('{:<10} {:8.3f} ms per call'.format(
+                name, total / repeat * 1e3))
+
+
+def _measure_throughput(cores, clip, duration):
+    from audio.processor import WavProcessor, session_config
+
+    data = _random_clip(clip)
+    config = session_config(intra_op_threads=cores, inter_op_threads=1)
+    # CPUs the process may use, cpusets and containers may leave out 0.
+    cpus = sorted(os.sched_getaffinity(0))[:cores]
+    with WavProcessor(config=config, cpus=cpus) as proc:
+        proc.get_predictions(params.SAMPLE_RATE, data)  # warm up
+        count = 0
+        start = time.time()
+        while time.time() - start < duration:
+            proc.get_predictions(params.SAMPLE_RATE, data)
+            count += 1
+        return count / (time.time() - start)
+
+
+def bench_threads(cores, clip, duration):
+    if not cores:
+        cores = range(1, len(os.sched_getaffinity(0)) + 1)
+
+    for count in cores:
+        # Fresh process per point, TensorFlow sizes its pools only once.
+        pool = multiprocessing.Pool(1)
+        rate = pool.apply(_measure_throughput, (count, clip, duration))
+        pool.close()
+        pool.join()
+        print('{:3d} cores {:8.2f} clips/s {:8.2f} x realtime'.format(
+            count, rate, rate*clip))
+
+
+if __name__ == '__main__':
+    args = vars(parser.parse_args())
+    command = args.pop('command')
+    globals()['bench_' + command](**args)
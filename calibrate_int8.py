@@ -0,0 +1,119 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import glob
+import logging.config
+import os
+import numpy as np
+from scipy.io import wavfile
+from log_config import LOGGING
+
+from audio import params
+from audio.utils import vggish
+
+
+parser = argparse.ArgumentParser(
+    description='Quantize VGGish to int8 and compare it with the float model')
+parser.add_argument('wav_dir', type=str,
+                    help='Directory of 16-bit wav files for calibration')
+parser.add_argument('-o', '--output', type=str,
+                    default=params.VGGISH_INT8_WEIGHTS, metavar='PATH',
+                    help='Int8 weights file to write', dest='quantized_path')
+parser.add_argument('--weights', type=str,
+                    default=params.VGGISH_NUMPY_WEIGHTS, metavar='PATH',
+                    help='Float weights from export_weights.py',
+                    dest='weights_path')
+parser.add_argument('--reference', choices=('tf', 'numpy'), default='tf',
+                    help='VGGish backend of the float model in the report')
+parser.add_argument('--top_k', type=int, default=5, metavar='K',
+                    help='Labels compared per file in the report')
+parser.add_argument('--no_report', action='store_false', dest='report',
+                    help='Only write the int8 weights')
+
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger('audio_analysis.calibrate_int8')
+
+
+def read_wavs(wav_dir):
+    """
+    Read wav files of a directory
+    :param wav_dir: Directory path
+    :return: Generator of (path, sample_rate, int16 data)
+    """
+    for path in sorted(glob.glob(os.path.join(wav_dir, '*.wav'))):
+        sr, data = wavfile.read(path)
+        if data.dtype != np.int16:
+            logger.warning('Skip "{}", bad sample type: {!r}'.format(
+                path, data.dtype))
+            continue
+        yield path, sr, data
+
+
+def calibration_examples(wav_dir):
+    for path, sr, data in read_wavs(wav_dir):
+        examples_batch = vggish.input.waveform_to_examples(
+            data / 32768.0, sr)
+        if examples_batch.shape[0]:
+            yield examples_batch
+
+
+def report(wav_dir, reference, quantized_path, top_k):
+    """
+    Log how often int8 predictions agree with the float model
+    :param wav_dir: Directory of wav files
+    :param reference: VGGish backend of the float model
+    :param quantized_path: Int8 weights file
+    :param top_k: Labels compared per file
+    :return: (top-1 agreement, mean top-k overlap), fractions of files
+    """
+    # local import to reduce start-up time
+    from audio.processor import WavProcessor
+
+    top1 = []
+    overlap = []
+    with WavProcessor(vggish_backend=reference) as float_proc, \
+            WavProcessor(vggish_backend='int8',
+                         vggish_weights=quantized_path) as int8_proc:
+        for path, sr, data in read_wavs(wav_dir):
+            float_labels = [label for label, score in
+                            float_proc.get_predictions(sr, data)[:top_k]]
+            int8_labels = [label for label, score in
+                           int8_proc.get_predictions(sr, data)[:top_k]]
+
+            top1.append(float_labels[:1] == int8_labels[:1])
+            common = len(set(float_labels) & set(int8_labels))
+            overlap.append(
+                common / max(len(float_labels), len(int8_labels), 1))
+            logger.info('"{}": top-1 {}, top-{} overlap {:.2f}'.format(
+                path, 'same' if top1[-1] else 'differs', top_k, overlap[-1]))
+
+    if not top1:
+        raise ValueError('No wav files in "{}"'.format(wav_dir))
+    return float(np.mean(top1)), float(np.mean(overlap))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    vggish.numpy_model.quantize_weights(
+        args.weights_path, args.quantized_path,
+        calibration_examples(args.wav_dir))
+    logger.info('"{}" exported.'.format(args.quantized_path))
+
+    if args.report:
+        top1, overlap = report(args.wav_dir, args.reference,
+                               args.quantized_path, args.top_k)
+        logger.info('Top-1 agreement {:.1%}, mean top-{} overlap {:.1%}'
+                    .format(top1, args.top_k, overlap))
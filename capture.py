@@ -13,16 +13,19 @@
 # limitations under the License.
 
 import argparse
+import json
 import logging.config
-import threading
-import time
 import os
 import numpy as np
-from scipy.io import wavfile
 from log_config import LOGGING
 
-from audio.captor import Captor
-from audio.processor import WavProcessor, format_predictions
+from audio.sources import create_sources
+from audio.pipeline import OVERFLOW_POLICIES, Pipeline
+from audio.scheduler import InferenceScheduler, STALE_POLICIES
+from audio.streams import CaptureStream
+from audio.gate import EnergyGate
+from audio.processor import GraphProcessor, WavProcessor, \
+    format_predictions, session_config
 
 
 parser = argparse.ArgumentParser(description='Capture and process audio')
@@ -33,6 +36,83 @@ parser.add_argument('--max_time', type=float, default=7, metavar='SECONDS',
 parser.add_argument('-s', '--save_path', type=str, metavar='PATH',
                     help='Save captured audio samples to provided path',
                     dest='path')
+parser.add_argument('--source', type=str, action='append', metavar='SPEC',
+                    help='Audio source: mic, mic:DEVICE, mic:DEVICE:CHANNEL, '
+                         'wav:PATH, pcm:PATH (pcm:- for stdin) or '
+                         'tcp:HOST:PORT, PCM is 16 kHz mono little-endian '
+                         'int16, prefix with NAME= to name it, repeat to '
+                         'analyze several streams with one model')
+parser.add_argument('--speed', type=float, default=1.0,
+                    help='Replay speed of wav sources, 0 for as fast as '
+                         'possible')
+parser.add_argument('--loop', action='store_true',
+                    help='Replay wav sources forever')
+parser.add_argument('--period', type=float, metavar='SECONDS',
+                    help='Capture through audio callbacks of this period '
+                         'instead of blocking one second reads')
+parser.add_argument('--hop', type=float, metavar='SECONDS',
+                    help='Classify a sliding window every hop instead of '
+                         'each capture, use with capture times near the hop')
+parser.add_argument('--window', type=float, default=5, metavar='SECONDS',
+                    help='Audio classified at a time with --hop')
+parser.add_argument('--max_batch', type=int, default=8, metavar='N',
+                    help='Streams processed in one model run at most')
+parser.add_argument('--queue_size', type=int, default=4, metavar='N',
+                    help='Captures queued per stream, the oldest one is '
+                         'dropped for a new one')
+parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                    help='Time a capture may wait for processing before '
+                         'it is dropped or merged, see --stale')
+parser.add_argument('--stale', choices=STALE_POLICIES, default='drop',
+                    help='Drop captures past the deadline, keeping the '
+                         'newest one, or merge queued captures into one')
+parser.add_argument('--weight', type=str, action='append', default=[],
+                    metavar='NAME=WEIGHT', dest='weights',
+                    help='Processor share of a stream relative to others, 1 '
+                         'by default')
+parser.add_argument('--stage_queue', type=int, default=2, metavar='N',
+                    help='Batches queued between feature, inference and '
+                         'output stages')
+parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default='block',
+                    help='When a stage falls behind, wait for it, drop the '
+                         'oldest queued batch or merge batches into one')
+parser.add_argument('--gate_level', type=float, metavar='DBFS',
+                    help='Skip inference on audio quieter than this, about '
+                         '-60 for a quiet room')
+parser.add_argument('--gate_flux', type=float, metavar='FLUX',
+                    help='Also classify audio with this much spectral flux, '
+                         'e.g. 0.5, see audio/gate.py')
+parser.add_argument('--gate_hangover', type=int, default=2, metavar='N',
+                    help='Examples of ~1 s classified after the last loud '
+                         'one')
+parser.add_argument('--float32', action='store_true',
+                    help='Compute audio features in single precision')
+parser.add_argument('--vggish_backend', choices=('tf', 'numpy', 'int8'),
+                    default='tf',
+                    help='Run VGGish in TensorFlow, in NumPy with weights '
+                         'from export_weights.py or in NumPy with int8 '
+                         'weights from calibrate_int8.py, which saves '
+                         'memory but not time')
+parser.add_argument('--bundle', type=str, metavar='PATH',
+                    help='Model bundle or weight store from export_bundle.py')
+parser.add_argument('--cascade', type=str, metavar='PATH',
+                    help='Skip the classifier for clips the linear cascade '
+                         'from fit_cascade.py is confident about')
+parser.add_argument('--log_embeddings', type=str, metavar='DIR',
+                    help='Log clip embeddings and classifier scores to this '
+                         'directory for fit_cascade.py')
+parser.add_argument('--graph', action='store_true',
+                    help='Run whole inference as one graph, needs model '
+                         'bundle from export_bundle.py')
+parser.add_argument('--intra_threads', type=int, default=0, metavar='N',
+                    help='TensorFlow threads inside one op, 0 for default')
+parser.add_argument('--inter_threads', type=int, default=0, metavar='N',
+                    help='TensorFlow ops run in parallel, 0 for default')
+parser.add_argument('--per_session_threads', action='store_true',
+                    help='Give each model session its own thread pools '
+                         'instead of sharing one')
+parser.add_argument('--cpus', type=int, nargs='+', metavar='CPU',
+                    help='Pin inference to these CPUs')
 
 
 logging.config.dictConfig(LOGGING)
@@ -40,61 +120,97 @@ logger = logging.getLogger('audio_analysis.capture')
 
 
 class Capture(object):
-    _ask_data = None
-    _captor = None
-    _save_path = None
-    _processor_sleep_time = 0.01
-    _process_buf = None
     _sample_rate = 16000
-
-    def __init__(self, min_time, max_time, path=None):
+    _pipeline = None
+
+    def __init__(self, min_time, max_time, path=None, float32=False,
+                 graph=False, intra_threads=0, inter_threads=0,
+                 per_session_threads=False, cpus=None, vggish_backend='tf',
+                 bundle=None, hop=None, window=5, period=None, source='mic',
+                 speed=1.0, loop=False, max_batch=8, queue_size=4,
+                 deadline=None, stale='drop', weights=(), gate_level=None,
+                 gate_flux=None, gate_hangover=2, cascade=None,
+                 log_embeddings=None, stage_queue=2, overflow='block'):
         if path is not None:
             if not os.path.exists(path):
                 raise FileNotFoundError('"{}" doesn\'t exist'.format(path))
             if not os.path.isdir(path):
                 raise FileNotFoundError('"{}" isn\'t a directory'.format(path))
 
-        self._save_path = path
-        self._ask_data = threading.Event()
-        self._captor = Captor(min_time, max_time, self._ask_data, self._process)
+        self._dtype = np.float32 if float32 else np.float64
+        self._graph = graph
+        self._vggish_backend = vggish_backend
+        self._cascade = cascade
+        self._log_embeddings = log_embeddings
+        self._processor_options = {
+            'config': session_config(intra_threads, inter_threads,
+                                     not per_session_threads),
+            'cpus': cpus,
+        }
+        if bundle:
+            self._processor_options['bundle'] = bundle
+        if source is None or isinstance(source, str):
+            source = [source or 'mic']
+        gated = gate_level is not None or gate_flux is not None
+        streams = [
+            CaptureStream(name, min_time, max_time, period=period,
+                          source=audio_source,
+                          gate=EnergyGate(gate_level, gate_flux,
+                                          gate_hangover) if gated else None)
+            for name, audio_source in create_sources(
+                source, self._sample_rate, speed, loop, period)]
+
+        weights = dict((name, float(weight)) for name, _, weight in
+                       (w.rpartition('=') for w in weights))
+        scheduler = InferenceScheduler(max_batch)
+        for stream in streams:
+            scheduler.add_stream(stream, weights.get(stream.name, 1.0),
+                                 queue_size, deadline, stale)
+        self._prefix = len(streams) > 1
+        self._pipeline = Pipeline(streams, self._log_predictions,
+                                  self._sample_rate, hop, window, scheduler,
+                                  stage_queue, overflow, path)
 
     def start(self):
-        self._captor.start()
-        self._process_loop()
-
-    def _process(self, data):
-        self._process_buf = np.frombuffer(data, dtype=np.int16)
-
-    def _process_loop(self):
-        with WavProcessor() as proc:
-            self._ask_data.set()
-            while True:
-                if self._process_buf is None:
-                    # Waiting for data to process
-                    time.sleep(self._processor_sleep_time)
-                    continue
-
-                self._ask_data.clear()
-                if self._save_path:
-                    f_path = os.path.join(
-                        self._save_path, 'record_{:.0f}.wav'.format(time.time())
-                    )
-                    wavfile.write(f_path, self._sample_rate, self._process_buf)
-                    logger.info('"{}" saved.'.format(f_path))
-
-                logger.info('Start processing.')
-                predictions = proc.get_predictions(
-                    self._sample_rate, self._process_buf)
-                logger.info(
-                    'Predictions: {}'.format(format_predictions(predictions))
-                )
-
-                logger.info('Stop processing.')
-                self._process_buf = None
-                self._ask_data.set()
+        if self._graph:
+            proc = GraphProcessor(**self._processor_options)
+        else:
+            proc = WavProcessor(self._dtype,
+                                vggish_backend=self._vggish_backend,
+                                cascade=self._cascade,
+                                embedding_log=self._log_embeddings,
+                                **self._processor_options)
+
+        with proc:
+            self._pipeline.run(proc)
+        logger.info('Audio sources ended.')
+
+        stats = self._pipeline.stats()
+        for name, stream_stats in sorted(stats['streams'].items()):
+            logger.info('Stream "{}": {}'.format(
+                name, json.dumps(stream_stats, sort_keys=True)))
+        logger.info('Stage queues: {}'.format(
+            json.dumps(stats['queues'], sort_keys=True)))
+
+    def _log_predictions(self, stream, end, predictions):
+        prefix = '{}: '.format(stream.name) if self._prefix else ''
+        if end is not None:
+            logger.info('{}Predictions at {:.2f}s: {}'.format(
+                prefix, end, format_predictions(predictions)))
+        else:
+            logger.info(
+                '{}Predictions: {}'.format(
+                    prefix, format_predictions(predictions))
+            )
 
 
 if __name__ == '__main__':
     args = parser.parse_args()
+    if args.graph and (args.cascade or args.log_embeddings):
+        parser.error('--cascade and --log_embeddings are not supported with '
+                     '--graph')
+    if args.graph and (args.float32 or args.vggish_backend != 'tf'):
+        parser.error('--graph runs its own float32 frontend and TensorFlow '
+                     'VGGish, --float32 and --vggish_backend don\'t apply')
     c = Capture(**vars(args))
     c.start()
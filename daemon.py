@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
 import time
 import json
 import threading
@@ -20,11 +19,15 @@ import logging.config
 import datetime
 import numpy as np
 from collections import deque
-from scipy.io import wavfile
 from devicehive_webconfig import Server, Handler
 
-from audio.captor import Captor
-from audio.processor import WavProcessor, format_predictions
+from audio.sources import create_sources
+from audio.pipeline import Pipeline
+from audio.scheduler import InferenceScheduler
+from audio.streams import CaptureStream
+from audio.gate import EnergyGate
+from audio.predictions import QUIET, format_predictions
+from audio.processor import GraphProcessor, WavProcessor
 from web.routes import routes
 
 from log_config import LOGGING
@@ -54,79 +57,117 @@ class DeviceHiveHandler(Handler):
 
 class Daemon(Server):
     _process_thread = None
-    _process_buf = None
-    _ask_data_event = None
     _shutdown_event = None
-    _captor = None
+    _streams = None
     _sample_rate = 16000
-    _processor_sleep_time = 0.01
+    _stats_interval = 60  # seconds between pipeline stats in the log
+    _stats_time = 0
 
     events_queue = None
+    pipeline = None
 
     def __init__(self, *args, **kwargs):
         min_time = kwargs.pop('min_capture_time', 5)
         max_time = kwargs.pop('max_capture_time', 5)
-        self._save_path = kwargs.pop('save_path', None)
+        # Callback capture period in seconds, see Captor.
+        period = kwargs.pop('capture_period', None)
+        # Audio source specs, one stream each, or a single spec, see
+        # sources.create_sources.
+        source = kwargs.pop('source', 'mic')
+        sources = create_sources([source] if isinstance(source, str)
+                                 else source,
+                                 self._sample_rate,
+                                 kwargs.pop('source_speed', 1.0),
+                                 kwargs.pop('source_loop', False), period)
+        save_path = kwargs.pop('save_path', None)
+        self._dtype = kwargs.pop('dtype', np.float64)
+        self._graph = kwargs.pop('graph', False)
+        self._vggish_backend = kwargs.pop('vggish_backend', 'tf')
+        # Sliding-window mode when a hop is given, see
+        # WavProcessor.get_sliding_predictions.
+        hop = kwargs.pop('hop_seconds', None)
+        window = kwargs.pop('window_seconds', 5)
+        # WavProcessor/GraphProcessor "config", "cpus" and "bundle"
+        # arguments.
+        self._processor_options = kwargs.pop('processor_options', {})
+        # Streams batched together at most, see InferenceScheduler.
+        max_batch = kwargs.pop('max_batch', 8)
+        # InferenceScheduler.add_stream "queue_size", "deadline" and
+        # "stale" arguments, and "weights" dict of stream name to weight.
+        stream_options = dict(kwargs.pop('stream_options', {}))
+        weights = stream_options.pop('weights', {})
+        # EnergyGate arguments, quiet audio isn't classified when given.
+        gate_options = kwargs.pop('gate_options', None)
+        # Pipeline "queue_size" and "overflow" arguments of the queues
+        # between feature, inference and sink stages.
+        pipeline_options = kwargs.pop('pipeline_options', {})
 
         super(Daemon, self).__init__(*args, **kwargs)
 
-        self.events_queue = deque(maxlen=10)
-        self._ask_data_event = threading.Event()
+        self.events_queue = deque(maxlen=10*len(sources))
         self._shutdown_event = threading.Event()
         self._process_thread = threading.Thread(target=self._process_loop,
                                                 name='processor')
         self._process_thread.setDaemon(True)
 
-        self._captor = Captor(min_time, max_time, self._ask_data_event,
-                              self._process, self._shutdown_event)
-
-    def _start_capture(self):
-        logger.info('Start captor')
-        self._captor.start()
+        self._streams = [
+            CaptureStream(name, min_time, max_time, self._shutdown_event,
+                          period, source,
+                          EnergyGate(**gate_options) if gate_options
+                          else None)
+            for name, source in sources]
+        scheduler = InferenceScheduler(max_batch)
+        for stream in self._streams:
+            scheduler.add_stream(stream, weights.get(stream.name, 1.0),
+                                 **stream_options)
+        self.pipeline = Pipeline(self._streams, self._on_predictions,
+                                 self._sample_rate, hop, window, scheduler,
+                                 save_path=save_path, **pipeline_options)
 
     def _start_process(self):
         logger.info('Start processor loop')
         self._process_thread.start()
 
-    def _process(self, data):
-        self._process_buf = np.frombuffer(data, dtype=np.int16)
-
     def _on_startup(self):
         self._start_process()
-        self._start_capture()
 
     def _on_shutdown(self):
         self._shutdown_event.set()
+        self.pipeline.stop()
 
     def _process_loop(self):
-        with WavProcessor() as proc:
-            self._ask_data_event.set()
-            while self.is_running:
-                if self._process_buf is None:
-                    # Waiting for data to process
-                    time.sleep(self._processor_sleep_time)
-                    continue
-
-                self._ask_data_event.clear()
-                if self._save_path:
-                    f_path = os.path.join(
-                        self._save_path, 'record_{:.0f}.wav'.format(time.time())
-                    )
-                    wavfile.write(f_path, self._sample_rate, self._process_buf)
-                    logger.info('"{}" saved'.format(f_path))
-
-                logger.info('Start processing')
-                predictions = proc.get_predictions(
-                    self._sample_rate, self._process_buf)
-                formatted = format_predictions(predictions)
-                logger.info('Predictions: {}'.format(formatted))
-
-                self.events_queue.append((datetime.datetime.now(), formatted))
-                self._send_dh(predictions)
-
-                logger.info('Stop processing')
-                self._process_buf = None
-                self._ask_data_event.set()
+        if self._graph:
+            proc = GraphProcessor(**self._processor_options)
+        else:
+            proc = WavProcessor(self._dtype,
+                                vggish_backend=self._vggish_backend,
+                                **self._processor_options)
+
+        self._stats_time = time.time()
+        with proc:
+            self.pipeline.run(proc)
+        logger.info('Processor loop stopped')
+
+    def _on_predictions(self, stream, end, predictions):
+        formatted = format_predictions(predictions)
+        logger.info('Predictions of "{}": {}'.format(stream.name, formatted))
+
+        self.events_queue.append(
+            (datetime.datetime.now(), stream.name, formatted))
+        if predictions == QUIET:
+            data = {'quiet': True}
+        elif len(self._streams) > 1:
+            data = {'predictions': predictions}
+        else:
+            data = predictions
+        if len(self._streams) > 1:
+            data['stream'] = stream.name
+        self._send_dh(data)
+
+        if time.time() - self._stats_time >= self._stats_interval:
+            self._stats_time = time.time()
+            logger.info('Pipeline stats: {}'.format(
+                json.dumps(self.pipeline.stats(), sort_keys=True)))
 
     def _send_dh(self, data):
         if not self.dh_status.connected:
@@ -0,0 +1,46 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging.config
+import time
+from log_config import LOGGING
+
+from audio import params
+from audio.bundle import export_bundle
+
+
+parser = argparse.ArgumentParser(
+    description='Freeze models into a bundle for fast start-up')
+parser.add_argument('-o', '--output', type=str, metavar='PATH',
+                    help='Bundle file to write, {} or {} by default'.format(
+                        params.MODEL_BUNDLE, params.MODEL_STORE),
+                    dest='path')
+parser.add_argument('--store', action='store_true',
+                    help='Write a memory-mapped weight store that analyzer '
+                         'processes share')
+
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger('audio_analysis.export_bundle')
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.path is None:
+        args.path = params.MODEL_STORE if args.store else params.MODEL_BUNDLE
+    start = time.time()
+    export_bundle(args.path, args.store)
+    logger.info('"{}" exported in {:.2f}s.'.format(
+        args.path, time.time() - start))
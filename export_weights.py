@@ -0,0 +1,42 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging.config
+from log_config import LOGGING
+
+from audio import params
+from audio.utils.vggish.numpy_model import export_weights
+
+
+parser = argparse.ArgumentParser(
+    description='Convert VGGish checkpoint for the NumPy backend')
+parser.add_argument('-o', '--output', type=str,
+                    default=params.VGGISH_NUMPY_WEIGHTS, metavar='PATH',
+                    help='Weights file to write', dest='weights_path')
+parser.add_argument('--no_check', action='store_false', dest='check',
+                    help='Skip comparing embeddings with TensorFlow')
+
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger('audio_analysis.export_weights')
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    diff = export_weights(params.VGGISH_MODEL, **vars(args))
+    logger.info('"{}" exported.'.format(args.weights_path))
+    if diff is not None:
+        logger.info('Max embedding difference from TensorFlow: {:.2e}'.format(
+            diff))
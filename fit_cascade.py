@@ -0,0 +1,105 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import logging.config
+import numpy as np
+from log_config import LOGGING
+
+from audio import params
+from audio.cascade import agreement, choose_threshold, fit_cascade, \
+    read_embedding_logs, LinearCascade
+
+
+parser = argparse.ArgumentParser(
+    description='Fit the linear cascade on logged embeddings and report how '
+                'well it agrees with the classifier')
+parser.add_argument('logs', type=str, nargs='+', metavar='PATH',
+                    help='Embedding log files or directories, written with '
+                         '--log_embeddings')
+parser.add_argument('-o', '--output', type=str,
+                    default=params.CASCADE_MODEL, metavar='PATH',
+                    help='Cascade file to write')
+parser.add_argument('--min_agreement', type=float, default=0.95,
+                    metavar='FRACTION',
+                    help='Share of clips answered by the cascade that must '
+                         'get the same top labels as the classifier')
+parser.add_argument('--top_k', type=int, default=3, metavar='K',
+                    help='Top labels that have to agree')
+parser.add_argument('--min_count', type=int, default=5, metavar='N',
+                    help='Clips a label must be reported for to be '
+                         'estimated by the cascade')
+parser.add_argument('--l2', type=float, default=1.0,
+                    help='Regularization strength')
+parser.add_argument('--test_fraction', type=float, default=0.2,
+                    metavar='FRACTION',
+                    help='Clips held out for the report')
+
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger('audio_analysis.fit_cascade')
+
+
+def report(cascade, pooled, scores):
+    """
+    Measure cascade paths on clips it wasn't fitted on
+    :param cascade: LinearCascade
+    :param pooled: (count, 2*EMBEDDING_SIZE) clips
+    :param scores: (count, num_classes) classifier scores
+    :return: (share of clips answered by the cascade, agreement of those,
+    None if there are none, agreement of all clips with the classifier)
+    """
+    estimates, confidence = cascade.estimate(pooled)
+    cheap = confidence >= cascade.threshold
+    agree = agreement(estimates, scores, cascade.top_k)
+    cheap_share = float(cheap.mean())
+    cheap_agreement = float(agree[cheap].mean()) if cheap.any() else None
+    # Clips that run the classifier agree by definition.
+    overall = float(np.where(cheap, agree, True).mean())
+    return cheap_share, cheap_agreement, overall
+
+
+def fit(logs, output, min_agreement=0.95, top_k=3, min_count=5, l2=1.0,
+        test_fraction=0.2):
+    pooled, scores = read_embedding_logs(logs)
+    logger.info('{} clips read.'.format(len(pooled)))
+
+    order = np.random.RandomState(0).permutation(len(pooled))
+    test_size = int(len(pooled) * test_fraction)
+    test, train = order[:test_size], order[test_size:]
+
+    model, confidence, agree = fit_cascade(pooled[train], scores[train],
+                                           top_k, min_count, l2)
+    model['threshold'] = np.array(choose_threshold(confidence, agree,
+                                                   min_agreement))
+    np.savez(output, **model)
+    logger.info('"{}" exported, {} labels estimated, threshold {:.3f}.'
+                .format(output, len(model['classes']),
+                        float(model['threshold'])))
+
+    if not test_size:
+        return
+    cheap_share, cheap_agreement, overall = report(
+        LinearCascade(output), pooled[test], scores[test])
+    logger.info('On {} held out clips: cascade path {:.1%}, classifier path '
+                '{:.1%}, top-{} agreement on the cascade path {}, '
+                'overall {:.1%}'.format(
+                    test_size, cheap_share, 1 - cheap_share, top_k,
+                    'n/a' if cheap_agreement is None
+                    else '{:.1%}'.format(cheap_agreement), overall))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    fit(**vars(args))
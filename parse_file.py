@@ -13,27 +13,331 @@
 # limitations under the License.
 
 import argparse
-import numpy as np
-from scipy.io import wavfile
+import glob
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import wave
+
+from audio import params
 
 parser = argparse.ArgumentParser(description='Read file and process audio')
-parser.add_argument('wav_file', type=str, help='File to read and process')
+parser.add_argument('wav_file', type=str, nargs='?',
+                    help='File to read and process, directory or glob '
+                         'pattern with --manifest')
+parser.add_argument('--server', type=str, nargs='?', metavar='SOCKET',
+                    const=params.ANALYZER_SOCKET,
+                    help='Let the resident analyzer listening on this socket '
+                         'process the file, see --serve')
+parser.add_argument('--send_pcm', action='store_true',
+                    help='Send samples to the analyzer instead of the path, '
+                         'for files it cannot read')
+parser.add_argument('--serve', type=str, nargs='?', metavar='SOCKET',
+                    const=params.ANALYZER_SOCKET,
+                    help='Keep models loaded and process files sent with '
+                         '--server on this socket')
+parser.add_argument('--manifest', type=str, metavar='PATH',
+                    help='Process many files and append results to this '
+                         'JSON lines file, files already in it are skipped')
+parser.add_argument('--workers', type=int, default=1, metavar='N',
+                    help='Processes for --manifest, each loads the models '
+                         'once')
+parser.add_argument('--segment', type=float, metavar='SECONDS',
+                    help='Print a timeline of labels per segment as JSON '
+                         'lines instead of labels for the whole file')
+parser.add_argument('--hop', type=float, metavar='SECONDS',
+                    help='Time between timeline segments, segment length by '
+                         'default')
+parser.add_argument('--float32', action='store_true',
+                    help='Compute audio features in single precision')
+parser.add_argument('--vggish_backend', choices=('tf', 'numpy', 'int8'),
+                    default='tf',
+                    help='Run VGGish in TensorFlow, in NumPy with weights '
+                         'from export_weights.py or in NumPy with int8 '
+                         'weights from calibrate_int8.py, which saves '
+                         'memory but not time')
+parser.add_argument('--bundle', type=str, metavar='PATH',
+                    help='Model bundle or weight store from export_bundle.py')
+parser.add_argument('--cascade', type=str, metavar='PATH',
+                    help='Skip the classifier for clips the linear cascade '
+                         'from fit_cascade.py is confident about')
+parser.add_argument('--log_embeddings', type=str, metavar='DIR',
+                    help='Log clip embeddings and classifier scores to this '
+                         'directory for fit_cascade.py')
+parser.add_argument('--graph', action='store_true',
+                    help='Run whole inference as one graph, needs model '
+                         'bundle from export_bundle.py')
+parser.add_argument('--intra_threads', type=int, default=0, metavar='N',
+                    help='TensorFlow threads inside one op, 0 for default')
+parser.add_argument('--inter_threads', type=int, default=0, metavar='N',
+                    help='TensorFlow ops run in parallel, 0 for default')
+parser.add_argument('--per_session_threads', action='store_true',
+                    help='Give each model session its own thread pools '
+                         'instead of sharing one')
+parser.add_argument('--cpus', type=int, nargs='+', metavar='CPU',
+                    help='Pin inference to these CPUs')
+
+
+# Audio read from the memory-mapped file per step in timeline mode.
+READ_SECONDS = 10
+
+
+def create_processor(float32=False, graph=False, intra_threads=0,
+                     inter_threads=0, per_session_threads=False, cpus=None,
+                     vggish_backend='tf', bundle=None, cascade=None,
+                     log_embeddings=None):
+    # local import to reduce start-up time
+    import numpy as np
+    from audio.processor import GraphProcessor, WavProcessor, session_config
+
+    options = {
+        'config': session_config(intra_threads, inter_threads,
+                                 not per_session_threads),
+        'cpus': cpus,
+    }
+    if bundle:
+        options['bundle'] = bundle
+    if graph:
+        return GraphProcessor(**options)
+    return WavProcessor(np.float32 if float32 else np.float64,
+                        vggish_backend=vggish_backend, cascade=cascade,
+                        embedding_log=log_embeddings, **options)
+
 
+def read_wav(wav_file, mmap=False):
+    import numpy as np
+    from scipy.io import wavfile
 
-def process_file(wav_file):
-    sr, data = wavfile.read(wav_file)
+    sr, data = wavfile.read(wav_file, mmap=mmap)
     if data.dtype != np.int16:
         raise TypeError('Bad sample type: %r' % data.dtype)
+    return sr, data
 
-    # local import to reduce start-up time
-    from audio.processor import WavProcessor, format_predictions
 
-    with WavProcessor() as proc:
+def process_file(wav_file, **processor_args):
+    sr, data = read_wav(wav_file)
+
+    from audio.predictions import format_predictions
+    with create_processor(**processor_args) as proc:
         predictions = proc.get_predictions(sr, data)
 
     print(format_predictions(predictions))
 
 
+def process_timeline(wav_file, segment, hop=None, out=sys.stdout,
+                     **processor_args):
+    """
+    Print labels per segment of a file as JSON lines while processing
+    :param wav_file: 16-bit wav file, read through a memory map in steps of
+    READ_SECONDS, so memory use doesn't depend on file length
+    :param segment: Segment length in seconds, rounded to whole examples
+    :param hop: Time between segments in seconds, segment by default
+    :param out: Text stream for {"start", "end", "labels"} records
+    :return:
+    """
+    sr, data = read_wav(wav_file, mmap=True)
+
+    import numpy as np
+    with create_processor(**processor_args) as proc:
+        stream = proc.create_sliding_stream(sr, segment, hop or segment)
+        window_seconds = stream.window * params.EXAMPLE_HOP_SECONDS
+        step = int(sr * READ_SECONDS)
+        for start in range(0, max(len(data), 1), step):
+            # Copy one step out of the mapping, pages read before can be
+            # dropped by the OS.
+            chunk = np.array(data[start:start + step])
+            results = proc.get_sliding_predictions(
+                stream, chunk, flush=start + step >= len(data))
+            for end, predictions in results:
+                out.write(json.dumps({
+                    'start': round(max(0.0, end - window_seconds), 3),
+                    'end': round(end, 3),
+                    'labels': [[label, round(score, 4)]
+                               for label, score in predictions],
+                }) + '\n')
+            out.flush()
+
+
+def find_files(pattern):
+    """
+    Expand batch input
+    :param pattern: Directory, searched recursively for .wav files, or glob
+    pattern, ** matches nested directories
+    :return: Sorted list of absolute paths
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '**', '*.wav')
+    paths = glob.glob(pattern, recursive=True)
+    return sorted(os.path.abspath(p) for p in paths if os.path.isfile(p))
+
+
+def read_manifest(manifest):
+    """
+    Read paths processed by earlier batch runs
+    :param manifest: JSON lines file written by process_batch
+    :return: Set of paths with a result, failed files are tried again
+    """
+    done = set()
+    if not os.path.exists(manifest):
+        return done
+
+    with open(manifest) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # line cut short by an interrupted run
+            if 'labels' in record:
+                done.add(record['path'])
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+_worker_processor = None
+_worker_error = None
+
+
+def _init_worker(processor_args):
+    global _worker_processor, _worker_error
+    # The pool starts a new worker for one whose initializer raised, so a
+    # failure is kept and reported for every file instead.
+    try:
+        _worker_processor = create_processor(**processor_args)
+    except Exception as e:
+        _worker_error = '{}: {}'.format(type(e).__name__, e)
+        return
+    # Closed when the worker exits normally, flushing embedding logs.
+    multiprocessing.util.Finalize(_worker_processor, _worker_processor.close,
+                                  exitpriority=0)
+
+
+def _process_path(path):
+    if _worker_error is not None:
+        return {'path': path, 'error': _worker_error}
+    try:
+        sr, data = read_wav(path)
+        predictions = _worker_processor.get_predictions(sr, data)
+    except Exception as e:
+        return {'path': path, 'error': '{}: {}'.format(type(e).__name__, e)}
+    return {'path': path,
+            'labels': [[label, round(score, 4)]
+                       for label, score in predictions]}
+
+
+def process_batch(wav_file, manifest, workers=1, **processor_args):
+    """
+    Process many files over a pool of workers, resuming earlier runs
+    :param wav_file: Directory or glob pattern, see find_files
+    :param manifest: JSON lines file, one {"path", "labels"} or
+    {"path", "error"} record is appended per file as results come in
+    :param workers: Worker processes, each creates one processor
+    :return: (processed, skipped, failed) file counts
+    """
+    paths = find_files(wav_file)
+    done = read_manifest(manifest)
+    todo = [p for p in paths if p not in done]
+
+    failed = 0
+    # Models are loaded in the workers only, the parent never imports them.
+    pool = multiprocessing.Pool(workers, _init_worker, (processor_args,))
+    try:
+        with open(manifest, 'a') as f:
+            if f.tell() and not _ends_with_newline(manifest):
+                f.write('\n')  # after a line cut short by an interrupted run
+            for record in pool.imap_unordered(_process_path, todo):
+                failed += 'error' in record
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+        # Let workers exit on their own, so their processors are closed.
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return len(todo) - failed, len(paths) - len(todo), failed
+
+
+def process_remote(wav_file, socket_path, send_pcm=False):
+    """
+    Print predictions of the resident analyzer, models are not loaded here
+    :param wav_file: 16-bit wav file
+    :param socket_path: Analyzer socket, see serve
+    :param send_pcm: Read the file here and send its samples
+    :return:
+    """
+    from audio.analyzer_client import analyze_file, analyze_pcm
+    from audio.predictions import format_predictions
+
+    if send_pcm:
+        with wave.open(wav_file) as w:
+            if w.getsampwidth() != 2:
+                raise TypeError(
+                    'Bad sample width: {}'.format(w.getsampwidth()))
+            predictions = analyze_pcm(
+                w.getframerate(), w.readframes(w.getnframes()),
+                w.getnchannels(), socket_path)
+    else:
+        predictions = analyze_file(os.path.abspath(wav_file), socket_path)
+
+    print(format_predictions(predictions))
+
+
+def serve(socket_path, **processor_args):
+    """
+    Run resident analyzer until interrupted
+    :param socket_path: Unix socket to listen on
+    :param processor_args: See create_processor
+    :return:
+    """
+    from audio.analyzer_server import AnalyzerServer
+
+    with create_processor(**processor_args) as proc:
+        server = AnalyzerServer(socket_path, proc)
+        print('Listening on "{}"'.format(socket_path))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
 if __name__ == '__main__':
     args = parser.parse_args()
-    process_file(**vars(args))
+    if args.graph and (args.cascade or args.log_embeddings):
+        parser.error('--cascade and --log_embeddings are not supported with '
+                     '--graph')
+    if args.graph and (args.float32 or args.vggish_backend != 'tf'):
+        parser.error('--graph runs its own float32 frontend and TensorFlow '
+                     'VGGish, --float32 and --vggish_backend don\'t apply')
+    args = vars(args)
+    segment, hop = args.pop('segment'), args.pop('hop')
+    manifest, workers = args.pop('manifest'), args.pop('workers')
+    server, send_pcm = args.pop('server'), args.pop('send_pcm')
+    socket_path = args.pop('serve')
+    if socket_path:
+        del args['wav_file']
+        serve(socket_path, **args)
+    elif args['wav_file'] is None:
+        parser.error('the following arguments are required: wav_file')
+    elif server:
+        if manifest or segment:
+            parser.error('--server processes single files only')
+        process_remote(args['wav_file'], server, send_pcm)
+    elif manifest:
+        if segment:
+            parser.error('--segment is not supported with --manifest')
+        counts = process_batch(manifest=manifest, workers=workers, **args)
+        print('{} files processed, {} skipped, {} failed'.format(*counts))
+    elif segment:
+        process_timeline(segment=segment, hop=hop, **args)
+    else:
+        process_file(**args)
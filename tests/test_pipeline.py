@@ -0,0 +1,200 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from audio.pipeline import BoundedQueue, Pipeline
+from audio.scheduler import InferenceScheduler
+
+
+class _Stream(object):
+    # Submits all its chunks on start, then ends like a finished captor
+    # unless ends is False.
+    def __init__(self, name, chunks, ends=True):
+        self.name = name
+        self.state = None
+        self.gate = None
+        self._chunks = chunks
+        self._ends = ends
+
+    def start(self, state, scheduler):
+        self.state = state
+        for i in range(self._chunks):
+            scheduler.submit(self, np.full(10, i, np.int16))
+        if self._ends:
+            scheduler.end_stream(self)
+
+    def reset(self):
+        pass
+
+
+class _Processor(object):
+    # Answers every chunk with a one-frame embedding and one label.
+    def __init__(self):
+        self.extracted = 0
+
+    def create_stream(self, sample_rate):
+        return object()
+
+    def get_stream_features_batch(self, chunks, gates):
+        self.extracted += len(chunks)
+        return [np.zeros((1, 2), np.float32) for _ in chunks]
+
+    def classify(self, features):
+        return [[('label', 1.0)] for _ in features]
+
+
+class BoundedQueueTest(unittest.TestCase):
+    def test_block_waits_for_consumer(self):
+        queue = BoundedQueue(1, 'block')
+        queue.put(1)
+        thread = threading.Thread(target=queue.put, args=(2,))
+        thread.start()
+        thread.join(0.05)
+        self.assertTrue(thread.is_alive())
+
+        self.assertEqual(queue.get(), 1)
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(queue.get(), 2)
+        self.assertEqual((queue.dropped, queue.coalesced), (0, 0))
+
+    def test_drop_oldest_reports_drops(self):
+        dropped = []
+        queue = BoundedQueue(2, 'drop_oldest', on_drop=dropped.append)
+        for i in range(5):
+            queue.put(i)
+
+        self.assertEqual(dropped, [0, 1, 2])
+        self.assertEqual(queue.dropped, 3)
+        self.assertEqual([queue.get(), queue.get()], [3, 4])
+
+    def test_coalesce_merges_into_newest(self):
+        queue = BoundedQueue(2, 'coalesce')
+        for i in range(4):
+            queue.put(([i], ['job{}'.format(i)]))
+
+        self.assertEqual(queue.coalesced, 2)
+        self.assertEqual(queue.dropped, 0)
+        self.assertEqual(queue.get(), ([0], ['job0']))
+        self.assertEqual(queue.get(),
+                         ([1, 2, 3], ['job1', 'job2', 'job3']))
+
+    def test_close_drains_then_drops(self):
+        dropped = []
+        queue = BoundedQueue(2, on_drop=dropped.append)
+        queue.put(1)
+        queue.close()
+        queue.put(2)
+
+        self.assertEqual(dropped, [2])
+        self.assertEqual(queue.get(), 1)
+        self.assertIsNone(queue.get())
+
+    def test_close_wakes_blocked_put(self):
+        dropped = []
+        queue = BoundedQueue(1, 'block', on_drop=dropped.append)
+        queue.put(1)
+        thread = threading.Thread(target=queue.put, args=(2,))
+        thread.start()
+        queue.close()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(dropped, [2])
+
+
+class PipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.proc = _Processor()
+
+    def _run(self, overflow, sink=None, chunks=20, max_batch=1):
+        streams = [_Stream('a', chunks), _Stream('b', chunks)]
+        scheduler = InferenceScheduler(max_batch)
+        for stream in streams:
+            scheduler.add_stream(stream, queue_size=chunks)
+        results = []
+
+        def collect(stream, end, predictions):
+            if sink is not None:
+                sink()
+            results.append((stream.name, predictions))
+
+        pipeline = Pipeline(streams, collect, scheduler=scheduler,
+                            queue_size=1, overflow=overflow)
+        thread = threading.Thread(target=pipeline.run, args=(self.proc,))
+        thread.start()
+        thread.join(10)
+        # Returns on its own once both streams ended and all is processed.
+        self.assertFalse(thread.is_alive())
+        return pipeline.stats(), results
+
+    def _accounted(self, stats):
+        return sum(s['processed'] + s['dropped'] + s['merged'] + s['queued']
+                   for s in stats['streams'].values())
+
+    def _held_sink(self, total):
+        # The first result waits until every chunk went through features,
+        # so the queues behind the sink overflow.
+        def sink():
+            deadline = time.time() + 5
+            while self.proc.extracted < total and time.time() < deadline:
+                time.sleep(0.001)
+        return sink
+
+    def test_block_processes_everything(self):
+        stats, results = self._run('block', max_batch=3)
+        self.assertEqual(len(results), 40)
+        for stream_stats in stats['streams'].values():
+            self.assertEqual(stream_stats['processed'], 20)
+            self.assertEqual(stream_stats['dropped'], 0)
+
+    def test_dropped_batches_are_counted_per_stream(self):
+        stats, results = self._run('drop_oldest', self._held_sink(40))
+        queue_drops = sum(q['dropped'] for q in stats['queues'].values())
+        stream_drops = sum(s['dropped'] for s in stats['streams'].values())
+        self.assertGreater(queue_drops, 0)
+        # One chunk per batch, so every dropped batch is one chunk.
+        self.assertEqual(stream_drops, queue_drops)
+        self.assertEqual(len(results), 40 - stream_drops)
+        self.assertEqual(self._accounted(stats), 40)
+
+    def test_coalesce_keeps_every_chunk(self):
+        stats, results = self._run('coalesce', self._held_sink(40))
+        self.assertGreater(
+            sum(q['coalesced'] for q in stats['queues'].values()), 0)
+        self.assertEqual(len(results), 40)
+        for stream_stats in stats['streams'].values():
+            self.assertEqual(stream_stats['processed'], 20)
+            self.assertEqual(stream_stats['dropped'], 0)
+
+    def test_stop_ends_run(self):
+        # A stream that never ends keeps the feature stage waiting.
+        streams = [_Stream('a', 0, ends=False)]
+        pipeline = Pipeline(streams, lambda *args: None)
+        thread = threading.Thread(target=pipeline.run, args=(self.proc,))
+        thread.start()
+        thread.join(0.05)
+        self.assertTrue(thread.is_alive())
+
+        pipeline.stop()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
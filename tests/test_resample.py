@@ -0,0 +1,95 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import numpy as np
+
+from audio.utils.resample import Resampler, resample
+
+
+RATES = (44100, 48000, 8000)
+
+
+def _noise(size, seed=0):
+    return np.random.RandomState(seed).uniform(-1, 1, size)
+
+
+def _push_in_pieces(resampler, data, seed=0):
+    # Random piece sizes, including empty and single sample pieces.
+    rng = np.random.RandomState(seed)
+    out = []
+    start = 0
+    while start < len(data):
+        size = rng.choice([0, 1, 3, 441, 1000, 4410, 70000])
+        out.append(resampler.push(data[start:start + size]))
+        start += size
+    return np.concatenate(out)
+
+
+class ResampleTest(unittest.TestCase):
+    def test_output_lengths(self):
+        for rate in RATES:
+            for size in (0, 1, 2, 441, 1009, rate, 3*rate + 7):
+                expected = -(-size*16000 // rate)
+                self.assertEqual(len(resample(_noise(size), rate, 16000)),
+                                 expected, (rate, size))
+
+    def test_same_rate_is_identity(self):
+        data = _noise(1000)
+        self.assertTrue(np.array_equal(resample(data, 16000, 16000), data))
+
+    def test_pieces_match_whole_signal(self):
+        for rate in RATES:
+            data = _noise(2*rate + 123, seed=rate)
+            whole = resample(data, rate, 16000)
+            for seed in range(3):
+                resampler = Resampler(rate, 16000)
+                # Zeros after the data flush the filter as resample does.
+                streamed = np.concatenate((
+                    _push_in_pieces(resampler, data, seed),
+                    resampler.push(np.zeros(rate))))[:len(whole)]
+                self.assertEqual(len(streamed), len(whole))
+                np.testing.assert_allclose(streamed, whole, rtol=0,
+                                           atol=1e-12)
+
+    def test_reset_starts_new_stream(self):
+        data = _noise(10000)
+        resampler = Resampler(44100, 16000)
+        expected = resampler.push(data)
+        resampler.push(_noise(777, seed=1))
+        resampler.reset()
+        np.testing.assert_allclose(resampler.push(data), expected, rtol=0,
+                                   atol=1e-12)
+
+    def test_tone_keeps_frequency(self):
+        for rate in RATES:
+            t = np.arange(rate) / float(rate)
+            tone = 0.5 * np.sin(2 * np.pi * 1000 * t)
+            out = resample(tone, rate, 16000)
+            t_out = np.arange(len(out)) / 16000.0
+            expected = 0.5 * np.sin(2 * np.pi * 1000 * t_out)
+            # Away from the edges, where the filter sees the zero padding.
+            np.testing.assert_allclose(out[1000:-1000],
+                                       expected[1000:-1000], atol=1e-3)
+
+    def test_dtype_follows_input(self):
+        data = _noise(4410).astype(np.float32)
+        self.assertEqual(resample(data, 44100, 16000).dtype, np.float32)
+        self.assertEqual(resample(data.astype(np.float64), 44100,
+                                  16000).dtype, np.float64)
+
+
+if __name__ == '__main__':
+    unittest.main()
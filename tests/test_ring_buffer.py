@@ -0,0 +1,82 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from collections import deque
+
+import numpy as np
+
+from audio.ring_buffer import RingBuffer
+
+
+class RingBufferTest(unittest.TestCase):
+    def _check_against_deque(self, channels, seed):
+        rng = np.random.RandomState(seed)
+        capacity = 50
+        ring = RingBuffer(capacity, channels)
+        model = deque()
+        shape = () if channels == 1 else (channels,)
+        counter = 0
+
+        for _ in range(2000):
+            if rng.rand() < 0.6:
+                count = rng.randint(0, 2 * capacity)
+                data = (counter + np.arange(count * max(channels, 1))) \
+                    .reshape((count,) + shape).astype(np.int16)
+                counter += data.size
+                model.extend(data)
+                expected_dropped = max(0, len(model) - capacity)
+                for _ in range(expected_dropped):
+                    model.popleft()
+                self.assertEqual(ring.write(data), expected_dropped)
+            else:
+                count = rng.randint(0, capacity + 10)
+                data = ring.read(count)
+                expected = [model.popleft()
+                            for _ in range(min(count, len(model)))]
+                self.assertEqual(data.dtype, np.int16)
+                self.assertEqual(data.shape[1:], shape)
+                self.assertTrue(np.array_equal(
+                    data, np.array(expected, np.int16).reshape(
+                        (len(expected),) + shape)))
+            self.assertEqual(len(ring), len(model))
+
+    def test_mono_matches_deque(self):
+        self._check_against_deque(1, seed=0)
+
+    def test_multichannel_matches_deque(self):
+        self._check_against_deque(2, seed=1)
+
+    def test_views_do_not_consume(self):
+        ring = RingBuffer(8)
+        ring.write(np.arange(6))
+        ring.read(4)
+        ring.write(np.arange(6, 12))
+        views = ring.views()
+        self.assertEqual(len(views), 2)
+        self.assertTrue(np.array_equal(np.concatenate(views),
+                                       np.arange(4, 12)))
+        self.assertEqual(len(ring), 8)
+        ring.consume(3)
+        self.assertTrue(np.array_equal(ring.read(), np.arange(7, 12)))
+
+    def test_oversized_write_keeps_newest(self):
+        ring = RingBuffer(5)
+        ring.write(np.arange(3))
+        self.assertEqual(ring.write(np.arange(10, 20)), 8)
+        self.assertTrue(np.array_equal(ring.read(), np.arange(15, 20)))
+
+
+if __name__ == '__main__':
+    unittest.main()
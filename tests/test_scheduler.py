@@ -0,0 +1,151 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import unittest
+
+import numpy as np
+
+from audio.scheduler import InferenceScheduler
+
+
+class _Stream(object):
+    def __init__(self, name):
+        self.name = name
+
+
+def _chunk(value, size=10):
+    return np.full(size, value, np.int16)
+
+
+class InferenceSchedulerTest(unittest.TestCase):
+    def _accounted(self, stats):
+        # Every submitted chunk ends up in exactly one counter.
+        return stats['processed'] + stats['dropped'] + stats['merged'] + \
+            stats['queued']
+
+    def test_weighted_fair_order(self):
+        scheduler = InferenceScheduler(max_batch=1)
+        heavy, light = _Stream('heavy'), _Stream('light')
+        scheduler.add_stream(heavy, weight=2.0, queue_size=100)
+        scheduler.add_stream(light, weight=1.0, queue_size=100)
+        for i in range(30):
+            scheduler.submit(heavy, _chunk(i))
+            scheduler.submit(light, _chunk(i))
+
+        served = [scheduler.next_batch(0)[0].stream for _ in range(30)]
+        self.assertEqual(served.count(heavy), 20)
+        self.assertEqual(served.count(light), 10)
+
+    def test_batch_takes_oldest_chunk_per_stream(self):
+        scheduler = InferenceScheduler(max_batch=8)
+        streams = [_Stream(str(i)) for i in range(3)]
+        for stream in streams:
+            scheduler.add_stream(stream)
+            scheduler.submit(stream, _chunk(1))
+            scheduler.submit(stream, _chunk(2))
+
+        batch = scheduler.next_batch(0)
+        self.assertEqual([c.stream for c in batch], streams)
+        self.assertTrue(all(c.data[0] == 1 for c in batch))
+
+    def test_full_queue_drops_oldest_and_resets(self):
+        scheduler = InferenceScheduler()
+        stream = _Stream('a')
+        scheduler.add_stream(stream, queue_size=2)
+        for i in range(5):
+            scheduler.submit(stream, _chunk(i))
+
+        batch = scheduler.next_batch(0)
+        self.assertEqual(batch[0].data[0], 3)
+        self.assertTrue(batch[0].reset)
+        stats = scheduler.stats()['a']
+        self.assertEqual(stats['dropped'], 3)
+        self.assertEqual(self._accounted(stats), 4)
+
+    def test_deadline_drop_keeps_newest(self):
+        scheduler = InferenceScheduler()
+        stream = _Stream('a')
+        scheduler.add_stream(stream, queue_size=10, deadline=0.01,
+                             stale='drop')
+        for i in range(4):
+            scheduler.submit(stream, _chunk(i))
+        time.sleep(0.02)
+
+        batch = scheduler.next_batch(0)
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(batch[0].data[0], 3)
+        self.assertTrue(batch[0].reset)
+        scheduler.done(batch)
+        stats = scheduler.stats()['a']
+        self.assertEqual((stats['processed'], stats['dropped']), (1, 3))
+        self.assertEqual(self._accounted(stats), stats['submitted'])
+
+    def test_deadline_merge_concatenates(self):
+        scheduler = InferenceScheduler()
+        stream = _Stream('a')
+        scheduler.add_stream(stream, queue_size=10, deadline=0.01,
+                             stale='merge')
+        scheduler.submit(stream, _chunk(0, 3))
+        scheduler.submit(stream, _chunk(1, 4), reset=True)
+        scheduler.submit(stream, _chunk(2, 5))
+        time.sleep(0.02)
+
+        batch = scheduler.next_batch(0)
+        self.assertEqual(len(batch), 1)
+        self.assertTrue(np.array_equal(
+            batch[0].data, np.repeat(np.arange(3), [3, 4, 5])))
+        self.assertTrue(batch[0].reset)
+        scheduler.done(batch)
+        stats = scheduler.stats()['a']
+        self.assertEqual((stats['processed'], stats['merged']), (1, 2))
+        self.assertEqual(self._accounted(stats), stats['submitted'])
+
+    def test_dropped_batches_are_counted(self):
+        scheduler = InferenceScheduler()
+        streams = [_Stream('a'), _Stream('b')]
+        for stream in streams:
+            scheduler.add_stream(stream)
+            scheduler.submit(stream, _chunk(0))
+            scheduler.submit(stream, _chunk(1))
+
+        scheduler.drop(scheduler.next_batch(0))
+        scheduler.done(scheduler.next_batch(0))
+        for name in ('a', 'b'):
+            stats = scheduler.stats()[name]
+            self.assertEqual((stats['processed'], stats['dropped']), (1, 1))
+            self.assertEqual(self._accounted(stats), stats['submitted'])
+
+    def test_next_batch_returns_after_streams_end(self):
+        scheduler = InferenceScheduler()
+        streams = [_Stream('a'), _Stream('b')]
+        for stream in streams:
+            scheduler.add_stream(stream)
+        scheduler.submit(streams[0], _chunk(0))
+        scheduler.end_stream(streams[0])
+        scheduler.end_stream(streams[1])
+
+        # Queued chunks are still handed out, then it doesn't block.
+        self.assertEqual(len(scheduler.next_batch()), 1)
+        self.assertEqual(scheduler.next_batch(), [])
+
+    def test_close_wakes_waiting_caller(self):
+        scheduler = InferenceScheduler()
+        scheduler.add_stream(_Stream('a'))
+        scheduler.close()
+        self.assertEqual(scheduler.next_batch(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import numpy as np
+
+try:
+    import tensorflow  # noqa: F401, audio.utils.vggish imports its model
+except ImportError:
+    raise unittest.SkipTest('TensorFlow is not installed')
+
+from audio import params
+from audio.sliding import SlidingStream
+from audio.utils.vggish import input
+
+
+def _embed(examples):
+    # Stands in for VGGish: any function of each example alone will do.
+    flat = examples.reshape(examples.shape[0], params.NUM_FRAMES *
+                            params.NUM_BANDS)
+    return flat[:, :params.EMBEDDING_SIZE].astype(np.float32)
+
+
+def _windows(window, hop, data, sizes):
+    # Push data in pieces of the given sizes, flushing with the last one,
+    # and add embeddings the way WavProcessor does.
+    stream = SlidingStream(input.StreamingFrontend(), window, hop)
+    windows = []
+    start = 0
+    for i, size in enumerate(sizes):
+        flush = i == len(sizes) - 1
+        examples = stream.push(data[start:start + size])
+        start += size
+        if examples.shape[0] or flush:
+            windows.extend(stream.add(_embed(examples), flush))
+    return [(end * params.EXAMPLE_HOP_SECONDS, w, active)
+            for end, w, active in windows]
+
+
+def _random_sizes(total, seed):
+    # Random piece sizes, including pieces shorter than one STFT hop.
+    rng = np.random.RandomState(seed)
+    sizes = []
+    while sum(sizes) < total:
+        sizes.append(int(rng.choice([1, 7, 160, 399, 4000, 16000, 25000])))
+    sizes[-1] -= sum(sizes) - total
+    return sizes
+
+
+class SlidingStreamTest(unittest.TestCase):
+    def test_windows_do_not_depend_on_chunking(self):
+        rng = np.random.RandomState(0)
+        data = rng.randint(-32768, 32768, 12 * params.SAMPLE_RATE) / 32768.0
+        for window, hop in ((5, 1), (5, 2), (3, 3), (2, 4)):
+            expected = _windows(window, hop, data, [len(data)])
+            self.assertTrue(expected)
+            for seed in range(3):
+                windows = _windows(window, hop, data,
+                                   _random_sizes(len(data), seed))
+                self.assertEqual([w[0] for w in windows],
+                                 [w[0] for w in expected])
+                for (_, w, active), (_, e, e_active) in zip(windows,
+                                                             expected):
+                    self.assertEqual(active, e_active)
+                    self.assertTrue(np.array_equal(w, e))
+
+    def test_windows_end_every_hop(self):
+        data = np.zeros(int(10.5 * params.SAMPLE_RATE))
+        windows = _windows(4, 3, data, [len(data)])
+        ends = [round(end / params.EXAMPLE_HOP_SECONDS) for end, _, _ in
+                windows]
+        # Hop ends at 3, 6, 9 examples, then the flushed end at 10.
+        self.assertEqual(ends, [3, 6, 9, 10])
+        self.assertEqual([w.shape[0] for _, w, _ in windows], [3, 4, 4, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# Copyright (C) 2017 DataArt
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import numpy as np
+
+try:
+    import tensorflow  # noqa: F401, audio.utils.vggish imports its model
+except ImportError:
+    raise unittest.SkipTest('TensorFlow is not installed')
+
+from audio import params
+from audio.utils.vggish import frontend, input, mel_features
+
+
+def _waveform(seconds, seed=0):
+    rng = np.random.RandomState(seed)
+    data = rng.randint(-32768, 32768, int(seconds * params.SAMPLE_RATE))
+    return data.astype(np.int16) / 32768.0
+
+
+def _push_in_pieces(stream, data, seed=0):
+    # Random piece sizes, including pieces shorter than one STFT hop.
+    rng = np.random.RandomState(seed)
+    examples = []
+    start = 0
+    while start < len(data):
+        size = rng.choice([1, 7, 160, 399, 4000, 16000, 25000])
+        examples.append(stream.push(data[start:start + size]))
+        start += size
+    return np.concatenate(examples)
+
+
+class StreamingFrontendTest(unittest.TestCase):
+    def test_pieces_match_whole_waveform(self):
+        data = _waveform(6.5)
+        for dtype in (np.float64, np.float32):
+            expected = input.waveform_to_examples(
+                data.astype(dtype), params.SAMPLE_RATE,
+                frontend.FrontendPlan(dtype))
+            stream = input.StreamingFrontend(
+                plan=frontend.FrontendPlan(dtype))
+            streamed = _push_in_pieces(stream, data.astype(dtype))
+            self.assertEqual(streamed.shape, expected.shape)
+            # Bit for bit, not just close.
+            self.assertTrue(np.array_equal(streamed, expected))
+
+    def test_reset_starts_new_stream(self):
+        data = _waveform(3, seed=1)
+        stream = input.StreamingFrontend()
+        stream.push(_waveform(1.3, seed=2))
+        stream.reset()
+        expected = input.waveform_to_examples(data, params.SAMPLE_RATE)
+        self.assertTrue(np.array_equal(_push_in_pieces(stream, data),
+                                       expected))
+
+    def test_plan_matches_log_mel_spectrogram(self):
+        data = _waveform(2, seed=3)
+        expected = mel_features.log_mel_spectrogram(
+            data,
+            audio_sample_rate=params.SAMPLE_RATE,
+            log_offset=params.LOG_OFFSET,
+            window_length_secs=params.STFT_WINDOW_LENGTH_SECONDS,
+            hop_length_secs=params.STFT_HOP_LENGTH_SECONDS,
+            num_mel_bins=params.NUM_MEL_BINS,
+            lower_edge_hertz=params.MEL_MIN_HZ,
+            upper_edge_hertz=params.MEL_MAX_HZ)
+        log_mel = frontend.FrontendPlan().log_mel_spectrogram(data)
+        np.testing.assert_allclose(log_mel, expected, rtol=0, atol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
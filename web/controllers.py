@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 from six import StringIO
 from six.moves import http_client
 from devicehive_webconfig.base import Controller, BaseController
@@ -30,9 +31,11 @@ class Events(Controller):
 class EventsUpdate(Controller):
     def get(self, handler, *args, **kwargs):
         f = StringIO()
-        for timestamp, predictions in handler.server.server.events_queue:
+        for timestamp, stream, predictions in \
+                handler.server.server.events_queue:
             data = {
                 'timestamp': '{:%Y-%m-%d %H:%M:%S}'.format(timestamp),
+                'stream': stream,
                 'predictions': predictions
             }
             f.writelines(self.render_template('event.html', **data))
@@ -44,3 +47,14 @@ class EventsUpdate(Controller):
         handler.send_header('Content-type', 'text/html')
         handler.end_headers()
         handler.wfile.write(response.encode())
+
+
+class StreamStats(Controller):
+    def get(self, handler, *args, **kwargs):
+        stats = handler.server.server.pipeline.stats()
+        response = json.dumps(stats, sort_keys=True)
+
+        handler.send_response(http_client.OK)
+        handler.send_header('Content-type', 'application/json')
+        handler.end_headers()
+        handler.wfile.write(response.encode())
@@ -12,9 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .controllers import Events, EventsUpdate
+from .controllers import Events, EventsUpdate, StreamStats
 
 routes = [
     (r'^/events/$', Events),
     (r'^/events/update/$', EventsUpdate),
+    (r'^/streams/stats/$', StreamStats),
 ]